@@ -4,7 +4,6 @@ from time import sleep
 from datetime import datetime
 from email import utils
 
-import pandas
 import pika
 from docx.shared import Mm
 from docxtpl import DocxTemplate, InlineImage
@@ -35,9 +34,10 @@ class RabbitMQConsumer:
         order_id = body.decode()
 
         # Log incoming order for debugging
-        error_data = [[str(now)[:-7], order_id]]
-        df = pandas.DataFrame(error_data, columns=["date", "order_id"])
-        log_engine.write_log(df, log_location=creds.webhook_order_log)
+        error_data = [str(now)[:-7], order_id]
+        log_engine.write_log_row(
+            error_data, ["date", "order_id"], log_location=creds.webhook_order_log
+        )
 
         # /luke
 
@@ -50,9 +50,18 @@ class RabbitMQConsumer:
             print(f"Getting Order Details", file=log_file)
 
             order = Order(order_id)
+            if order.header_fetch_ms is None:
+                print("Order header served from order store", file=log_file)
+            else:
+                print(f"Order header fetched in {order.header_fetch_ms} ms", file=log_file)
 
-            # Filter out DECLINED payments
-            if order.payment_status not in ["declined", ""]:
+            # Filter out DECLINED payments and digital (gift card) only orders from the header alone
+            if order.payment_status not in ["declined", ""] and not order.order_is_digital:
+                fetch_ms = order.prefetch()
+                if fetch_ms is None:
+                    print("Order products, coupons and shipping served from order store", file=log_file)
+                else:
+                    print(f"Order products, coupons and shipping fetched in {fetch_ms} ms", file=log_file)
                 bc_date = order.date_created
                 # Format Date and Time
                 dt_date = utils.parsedate_to_datetime(bc_date)
@@ -61,10 +70,14 @@ class RabbitMQConsumer:
                 products = order.order_products
                 product_list = []
                 gift_card_only = True
+                # Load every line item in one query
+                items = product_engine.get_products([x["sku"] for x in products])
                 for x in products:
                     if x["type"] == "physical":
                         gift_card_only = False
-                    item = product_engine.Product(x["sku"])
+                    item = items.get(x["sku"])
+                    if item is None:
+                        item = product_engine.get_product(x["sku"])
                     product_details = {
                         "sku": item.item_no,
                         "name": item.descr,
@@ -197,6 +210,9 @@ class RabbitMQConsumer:
                 # Gift Card Only
                 else:
                     print(f"Skipping Order #{order_id}: Gift Card Only", file=log_file)
+            # Digital Only
+            elif order.payment_status not in ["declined", ""]:
+                print(f"Skipping Order #{order_id}: Gift Card Only", file=log_file)
             # Declined Payments
             else:
                 print(
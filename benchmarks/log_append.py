@@ -0,0 +1,89 @@
+"""Measures log_engine append latency as a CSV log grows.
+
+Usage: python -m benchmarks.log_append [total_rows] [--legacy]
+
+Appends rows one at a time through the log_engine writer (the part of the log sink that
+touches the file) and reports the mean latency of
+a sample of appends at each checkpoint. The bulk of the file is filled with plain writes
+between checkpoints so millions of rows can be reached quickly. With --legacy the old
+read_csv-then-append approach is measured for comparison at the smaller checkpoints.
+"""
+import csv
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from setup import log_engine
+
+COLUMNS = ["date", "to_phone", "from_phone", "body", "name", "category", "media"]
+SAMPLE_SIZE = 1000
+LEGACY_SAMPLE_SIZE = 50
+LEGACY_MAX_ROWS = 100_000
+
+
+def sample_row(i):
+    return [str(datetime.now())[:-7], "+18285550100", f"+1828555{i % 10000:04d}",
+            f"Message body number {i}", "Unknown", "Unknown", "No Media"]
+
+
+def fill(log_location, start, stop):
+    """Grows the file without going through the writer being measured"""
+    with open(log_location, "a", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file, lineterminator=os.linesep)
+        if file.tell() == 0:
+            writer.writerow(COLUMNS)
+        writer.writerows(sample_row(i) for i in range(start, stop))
+
+
+def time_appends(append, log_location, start, sample_size=SAMPLE_SIZE):
+    began = time.perf_counter()
+    for i in range(start, start + sample_size):
+        append(sample_row(i), log_location)
+    return (time.perf_counter() - began) / sample_size * 1e6
+
+
+def append_current(row, log_location):
+    log_engine.writer.write_rows([row], COLUMNS, log_location)
+
+
+def append_legacy(row, log_location):
+    import pandas
+    df = pandas.DataFrame([row], columns=COLUMNS)
+    try:
+        pandas.read_csv(log_location)
+    except FileNotFoundError:
+        df.to_csv(log_location, mode="a", header=True, index=False)
+    else:
+        df.to_csv(log_location, mode="a", header=False, index=False)
+
+
+def main(total_rows=2_000_000, legacy=False):
+    checkpoints = [0, 10_000, 100_000, 500_000, 1_000_000, 2_000_000, 5_000_000]
+    checkpoints = [x for x in checkpoints if x <= total_rows]
+    with tempfile.TemporaryDirectory() as directory:
+        log_location = os.path.join(directory, "bench_log.csv")
+        legacy_location = os.path.join(directory, "bench_legacy.csv")
+        rows = 0
+        legacy_rows = 0
+        print(f"{'rows':>10}  {'writer (us)':>18}  {'legacy (us)':>12}")
+        for checkpoint in checkpoints:
+            fill(log_location, rows, checkpoint)
+            rows = checkpoint
+            current = time_appends(append_current, log_location, rows)
+            rows += SAMPLE_SIZE
+            legacy_result = "-"
+            if legacy and checkpoint <= LEGACY_MAX_ROWS:
+                fill(legacy_location, legacy_rows, checkpoint)
+                legacy_rows = checkpoint
+                legacy_time = time_appends(append_legacy, legacy_location, legacy_rows, LEGACY_SAMPLE_SIZE)
+                legacy_result = f"{legacy_time:.1f}"
+                legacy_rows += LEGACY_SAMPLE_SIZE
+            print(f"{checkpoint:>10,}  {current:>18.1f}  {legacy_result:>12}")
+        log_engine.writer.close()
+
+
+if __name__ == "__main__":
+    arguments = [x for x in sys.argv[1:] if not x.startswith("--")]
+    main(total_rows=int(arguments[0]) if arguments else 2_000_000, legacy="--legacy" in sys.argv)
@@ -0,0 +1,56 @@
+"""Compares per-lookup latency of literal and parameterized SKU lookups against Counterpoint.
+
+Usage: python -m benchmarks.query_params [number_of_skus] [rounds]
+
+Needs the SQL Server credentials in setup/creds.py. Each round looks up every sampled SKU once
+with the SKU written into the statement text and once with a ? placeholder. The literal form
+compiles a new ad-hoc plan per distinct SKU. The parameterized form reuses a single plan.
+Later rounds repeat the same literal text, so the first round shows the compile cost most clearly.
+"""
+import statistics
+import sys
+import time
+
+from setup.query_engine import QueryEngine
+
+LOOKUP = """
+SELECT ITEM.ITEM_NO, ITEM.DESCR, ITEM.PRC_1, PRC.PRC_2, ISNULL(INV.QTY_AVAIL, 0)
+FROM IM_ITEM ITEM
+INNER JOIN IM_PRC PRC ON ITEM.ITEM_NO=PRC.ITEM_NO
+LEFT OUTER JOIN IM_INV INV ON ITEM.ITEM_NO=INV.ITEM_NO
+WHERE ITEM.ITEM_NO = {placeholder}
+"""
+
+
+def time_lookups(db, skus, parameterized):
+    timings = []
+    for sku in skus:
+        began = time.perf_counter()
+        if parameterized:
+            db.query_db(LOOKUP.format(placeholder="?"), (sku,))
+        else:
+            db.query_db(LOOKUP.format(placeholder="'" + sku.replace("'", "''") + "'"))
+        timings.append((time.perf_counter() - began) * 1000)
+    return timings
+
+
+def main(number_of_skus=500, rounds=3):
+    db = QueryEngine()
+    response = db.query_db(f"SELECT TOP {int(number_of_skus)} ITEM_NO FROM IM_ITEM ORDER BY NEWID()")
+    skus = [x[0] for x in response] if response is not None else []
+    # Warm the connection pool so connection setup is not measured
+    db.query_db("SELECT 1")
+
+    print(f"{len(skus)} SKUs, {rounds} rounds")
+    print(f"{'round':>5}  {'literal mean (ms)':>18}  {'param mean (ms)':>16}  {'literal p95':>11}  {'param p95':>9}")
+    for i in range(rounds):
+        literal = time_lookups(db, skus, parameterized=False)
+        parameterized = time_lookups(db, skus, parameterized=True)
+        print(f"{i + 1:>5}  {statistics.mean(literal):>18.2f}  {statistics.mean(parameterized):>16.2f}  "
+              f"{statistics.quantiles(literal, n=20)[-1]:>11.2f}  {statistics.quantiles(parameterized, n=20)[-1]:>9.2f}")
+
+
+if __name__ == "__main__":
+    arguments = sys.argv[1:]
+    main(number_of_skus=int(arguments[0]) if arguments else 500,
+         rounds=int(arguments[1]) if len(arguments) > 1 else 3)
@@ -4,7 +4,6 @@ import sys
 import time
 from datetime import datetime
 
-import pandas
 import pika
 import requests
 from docxtpl import DocxTemplate
@@ -69,24 +68,22 @@ class RabbitMQConsumer:
         )
 
         design_lead_data = [
-            [
-                now_log_format,
-                first_name,
-                last_name,
-                email,
-                phone,
-                interested_in,
-                timeline,
-                street,
-                city,
-                state,
-                zip_code,
-                comments,
-            ]
+            now_log_format,
+            first_name,
+            last_name,
+            email,
+            phone,
+            interested_in,
+            timeline,
+            street,
+            city,
+            state,
+            zip_code,
+            comments,
         ]
-        df = pandas.DataFrame(
+        log_engine.write_log_row(
             design_lead_data,
-            columns=[
+            [
                 "date",
                 "first_name",
                 "last_name",
@@ -100,8 +97,8 @@ class RabbitMQConsumer:
                 "zip_code",
                 "comments",
             ],
+            creds.lead_log,
         )
-        log_engine.write_log(df, creds.lead_log)
 
         # Send text notification To sales team manager
         print(f"Sending SMS Message to Sales Team", file=log_file)
@@ -119,10 +116,11 @@ class RabbitMQConsumer:
             )
         except Exception as err:
             error_type = "sms"
-            error_data = [[now_log_format, error_type, err]]
-            df = pandas.DataFrame(error_data, columns=["date", "error_type", "message"])
-            log_engine.write_log(
-                df, f"{creds.lead_error_log}/error_{now:%m_%d_%y_%H_%M_%S}.csv"
+            error_data = [now_log_format, error_type, err]
+            log_engine.write_log_row(
+                error_data,
+                ["date", "error_type", "message"],
+                f"{creds.lead_error_log}/error_{now:%m_%d_%y_%H_%M_%S}.csv",
             )
             print(f"Error ({error_type}): {err}", file=log_file)
         else:
@@ -134,10 +132,11 @@ class RabbitMQConsumer:
             email_engine.design_email(first_name, email)
         except Exception as err:
             error_type = "email"
-            error_data = [[now_log_format, error_type, err]]
-            df = pandas.DataFrame(error_data, columns=["date", "error_type", "message"])
-            log_engine.write_log(
-                df, f"{creds.lead_error_log}/error_{now:%m_%d_%y_%H_%M_%S}.csv"
+            error_data = [now_log_format, error_type, err]
+            log_engine.write_log_row(
+                error_data,
+                ["date", "error_type", "message"],
+                f"{creds.lead_error_log}/error_{now:%m_%d_%y_%H_%M_%S}.csv",
             )
             print(f"Error ({error_type}): {err}", file=log_file)
         else:
@@ -177,10 +176,11 @@ class RabbitMQConsumer:
             os.remove(ticket_name)
         except Exception as err:
             error_type = "lead_ticket"
-            error_data = [[now_log_format, error_type, err]]
-            df = pandas.DataFrame(error_data, columns=["date", "error_type", "message"])
-            log_engine.write_log(
-                df, f"{creds.lead_error_log}/error_{now:%m_%d_%y_%H_%M_%S}.csv"
+            error_data = [now_log_format, error_type, err]
+            log_engine.write_log_row(
+                error_data,
+                ["date", "error_type", "message"],
+                f"{creds.lead_error_log}/error_{now:%m_%d_%y_%H_%M_%S}.csv",
             )
             print(f"Error ({error_type}): {err}", file=log_file)
         else:
@@ -216,10 +216,11 @@ class RabbitMQConsumer:
             )
         except Exception as err:
             error_type = "spreadsheet"
-            error_data = [[now_log_format, error_type, err]]
-            df = pandas.DataFrame(error_data, columns=["date", "error_type", "message"])
-            log_engine.write_log(
-                df, f"{creds.lead_error_log}/error_{now:%m_%d_%y_%H_%M_%S}.csv"
+            error_data = [now_log_format, error_type, err]
+            log_engine.write_log_row(
+                error_data,
+                ["date", "error_type", "message"],
+                f"{creds.lead_error_log}/error_{now:%m_%d_%y_%H_%M_%S}.csv",
             )
             print(f"Error ({error_type}): {err}", file=log_file)
         else:
@@ -5,7 +5,6 @@ from datetime import datetime
 
 import bleach
 import flask
-import pandas
 import pika
 import requests
 from flask import request, jsonify, abort
@@ -20,6 +19,9 @@ from waitress import serve
 from setup import creds, email_engine, sms_engine, authorization
 from setup import query_engine
 from setup import log_engine
+from setup import dedup_engine
+from setup import product_engine
+from setup import order_engine
 
 app = flask.Flask(__name__)
 
@@ -27,6 +29,16 @@ limiter = Limiter(get_remote_address, app=app)
 
 CORS(app)
 
+# Duplicate checks for sign-up logs. Built from the existing CSVs on startup.
+stock_notification_index = dedup_engine.DedupIndex(
+    creds.stock_notification_log,
+    columns=["date", "email", "item_no"],
+    key_columns=["email", "item_no"],
+)
+newsletter_index = dedup_engine.DedupIndex(
+    creds.newsletter_log, columns=["date", "email"], key_columns=["email"]
+)
+
 # When False, app is served by Waitress
 dev = False
 
@@ -91,26 +103,14 @@ def stock_notification():
     else:
         email = sanitized_data.get("email")
         item_no = sanitized_data.get("sku")
-        try:
-            df = pandas.read_csv(creds.stock_notification_log)
-        except FileNotFoundError:
-            pass
-        else:
-            entries = df.to_dict("records")
-            for x in entries:
-                if x["email"] == email and str(x["item_no"]) == item_no:
-                    return (
-                        "This email address is already on file for this item. We will send you an email "
-                        "when it comes back in stock. Please contact our office at "
-                        "<a href='tel:8288740679'>(828) 874-0679</a> if you need an alternative "
-                        "item. Thank you!"
-                    ), 400
-
-        stock_notification_data = [[str(datetime.now())[:-7], email, item_no]]
-        df = pandas.DataFrame(
-            stock_notification_data, columns=["date", "email", str("item_no")]
-        )
-        log_engine.write_log(df, creds.stock_notification_log)
+        stock_notification_data = [str(datetime.now())[:-7], email, item_no]
+        if not stock_notification_index.add(stock_notification_data):
+            return (
+                "This email address is already on file for this item. We will send you an email "
+                "when it comes back in stock. Please contact our office at "
+                "<a href='tel:8288740679'>(828) 874-0679</a> if you need an alternative "
+                "item. Thank you!"
+            ), 400
         return "Your submission was received."
 
 
@@ -131,16 +131,9 @@ def newsletter_signup():
         abort(400, description=e.message)
     else:
         email = data.get("email")
-        try:
-            df = pandas.read_csv(creds.newsletter_log)
-        except FileNotFoundError:
-            print("Coupon File Not Found")
-        else:
-            entries = df.to_dict("records")
-            for x in entries:
-                if x["email"] == email:
-                    print(f"{email} is already on file")
-                    return "This email address is already on file.", 400
+        if newsletter_index.contains(email):
+            print(f"{email} is already on file")
+            return "This email address is already on file.", 400
 
         recipient = {"": email}
         with open("./templates/new10.html", "r") as file:
@@ -175,9 +168,8 @@ def newsletter_signup():
             attachment=False,
         )
 
-        newsletter_data = [[str(datetime.now())[:-7], email]]
-        df = pandas.DataFrame(newsletter_data, columns=["date", "email"])
-        log_engine.write_log(df, creds.newsletter_log)
+        newsletter_data = [str(datetime.now())[:-7], email]
+        newsletter_index.add(newsletter_data)
         return "OK", 200
 
 
@@ -239,23 +231,21 @@ def incoming_sms():
         )
 
         log_data = [
-            [date, to_phone, from_phone, body, full_name, category.title(), media_url]
+            date,
+            to_phone,
+            from_phone,
+            body,
+            full_name,
+            category.title(),
+            media_url,
         ]
 
-        # Write dataframe to CSV file
-        df = pandas.DataFrame(
+        # Append row to CSV file
+        log_engine.write_log_row(
             log_data,
-            columns=[
-                "date",
-                "to_phone",
-                "from_phone",
-                "body",
-                "name",
-                "category",
-                "media",
-            ],
+            ["date", "to_phone", "from_phone", "body", "name", "category", "media"],
+            creds.incoming_sms_log,
         )
-        log_engine.write_log(df, creds.incoming_sms_log)
 
         # Return Response to Twilio
         resp = MessagingResponse()
@@ -270,10 +260,13 @@ def bc_orders():
     print(response_data)
     order_id = response_data["data"]["id"]
 
+    # The order changed, so a stored copy is out of date
+    order_engine.order_store.invalidate(order_id)
+
     # Add order to SQL Database. Datestamp and status are added by default.
-    query = f"INSERT INTO SN_ORDERS (ORDER_ID) VALUES ({order_id})"
+    query = "INSERT INTO SN_ORDERS (ORDER_ID) VALUES (?)"
     db = query_engine.QueryEngine()
-    insert_res = db.query_db(query, commit=True)
+    insert_res = db.query_db(query, (order_id,), commit=True)
     if insert_res.status_code != 200:
         print(f"Error inserting order {order_id} into SQL Database")
 
@@ -335,6 +328,24 @@ def get_availability():
         return jsonify({"error": "Error fetching data"}), 500
 
 
+@app.route("/search", methods=["GET"])
+@limiter.limit("60/minute")  # 60 requests per minute
+def search_products():
+    """Ranked product search over item descriptions and custom fields"""
+    query = bleach.clean(request.args.get("q", ""))
+    if not query.strip():
+        return jsonify({"error": "Missing search query"}), 400
+    filters = {}
+    for key in ["category", "subcategory"]:
+        if request.args.get(key):
+            filters[key] = bleach.clean(request.args.get(key))
+    if request.args.get("ecomm_only", "").lower() == "true":
+        filters["is_ecomm"] = "Y"
+    limit = max(1, min(request.args.get("limit", 25, type=int), 100))
+    results = product_engine.search(query, filters, limit)
+    return jsonify({"results": results}), 200
+
+
 @app.route("/health", methods=["GET"])
 @limiter.limit("10/minute")  # 10 requests per minute
 def health_check():
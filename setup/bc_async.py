@@ -0,0 +1,162 @@
+import asyncio
+import time
+
+import aiohttp
+
+from setup import creds
+from setup.bc_client import BC_BACKOFF, BC_RATE_LIMIT_RESERVE, BC_RETRIES, IDEMPOTENT_METHODS, RateLimit
+
+# Async Big Commerce Client Settings
+# Requests in flight at once
+BC_ASYNC_CONCURRENCY = 10
+BC_ASYNC_TIMEOUT = 30
+
+
+class AsyncRateLimit(RateLimit):
+    """Rate limit tracking for the async client. Waits with asyncio.sleep so the event loop keeps running.
+    Once the quota runs low, every request waits until the window resets, not just the one that saw it."""
+
+    def __init__(self, reserve=BC_RATE_LIMIT_RESERVE):
+        super().__init__(reserve)
+        self.blocked_until = 0
+
+    async def wait_async(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if self.requests_left is not None and self.requests_left <= self.reserve:
+                    self.blocked_until = self.reset_at
+                    self.requests_left = None
+                if self.blocked_until <= now:
+                    if self.requests_left is not None:
+                        self.requests_left -= 1
+                    return
+                delay = self.blocked_until - now
+            await asyncio.sleep(delay)
+
+
+class BCAsyncClient:
+    """Asyncio Big Commerce client for bulk jobs. Every request waits on a semaphore, so callers can
+    gather thousands of calls and at most `concurrency` are in flight. base_url can point at a local
+    mock server for testing.
+
+        async with BCAsyncClient() as client:
+            products = await client.gather(client.get_product(x) for x in product_ids)
+    """
+
+    def __init__(self, base_url=None, access_token=None, concurrency=BC_ASYNC_CONCURRENCY,
+                 timeout=BC_ASYNC_TIMEOUT, retries=BC_RETRIES, backoff=BC_BACKOFF):
+        self.base_url = base_url or f"https://api.bigcommerce.com/stores/{creds.big_store_hash}"
+        self.headers = {
+            'X-Auth-Token': access_token or creds.big_access_token,
+            'Content-Type': 'application/json',
+            'Accept': 'application/json'
+        }
+        self.concurrency = concurrency
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.rate_limit = AsyncRateLimit()
+        self.semaphore = None
+        self.session = None
+
+    async def __aenter__(self):
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        self.session = aiohttp.ClientSession(headers=self.headers, timeout=self.timeout, connector=connector)
+        return self
+
+    async def __aexit__(self, *args):
+        await self.session.close()
+
+    async def request(self, method, path, **kwargs):
+        """Sends a request to a path under the store. Returns (status, parsed JSON or None)."""
+        method = method.upper()
+        async with self.semaphore:
+            for attempt in range(self.retries + 1):
+                await self.rate_limit.wait_async()
+                try:
+                    async with self.session.request(method, self.base_url + path, **kwargs) as response:
+                        self.rate_limit.update(response)
+                        status = response.status
+                        data = await response.json(content_type=None) if status != 204 else None
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as err:
+                    if method not in IDEMPOTENT_METHODS or attempt == self.retries:
+                        raise
+                    print(f"Big Commerce request failed ({err}). Retrying ({attempt + 1}/{self.retries})")
+                    await asyncio.sleep(self.backoff * 2 ** attempt)
+                    continue
+                if attempt == self.retries:
+                    return status, data
+                if status == 429:
+                    await asyncio.sleep(self.rate_limit.reset_delay() or self.backoff)
+                elif status >= 500 and method in IDEMPOTENT_METHODS:
+                    await asyncio.sleep(self.backoff * 2 ** attempt)
+                else:
+                    return status, data
+
+    async def gather(self, coroutines):
+        """Runs coroutines concurrently, bounded by the client's semaphore. Failed calls are
+        returned as exceptions in place of their results."""
+        return await asyncio.gather(*coroutines, return_exceptions=True)
+
+    # Catalog
+    async def get_product(self, product_id):
+        status, data = await self.request("GET", f"/v3/catalog/products/{product_id}")
+        if status == 200:
+            return data
+
+    async def update_product(self, product_id, payload):
+        status, data = await self.request("PUT", f"/v3/catalog/products/{product_id}", json=payload)
+        if status != 404:
+            return data
+
+    async def get_variant(self, product_id, variant_id):
+        status, data = await self.request("GET", f"/v3/catalog/products/{product_id}/variants/{variant_id}")
+        return data
+
+    async def create_product(self, name, product_type, sku, weight, price):
+        payload = {
+            'name': name,
+            'type': product_type,
+            'sku': sku,
+            'weight': weight,
+            'price': price
+        }
+        status, data = await self.request("POST", "/v3/catalog/products", json=payload)
+        return data
+
+    # Orders
+    async def get_order(self, order_id):
+        status, data = await self.request("GET", f"/v2/orders/{order_id}")
+        if status == 200:
+            return data
+
+    async def get_order_products(self, order_id):
+        status, data = await self.request("GET", f"/v2/orders/{order_id}/products")
+        if status == 200:
+            return data
+
+    async def get_order_coupons(self, order_id):
+        status, data = await self.request("GET", f"/v2/orders/{order_id}/coupons")
+        if status == 200:
+            return data
+
+    async def get_order_shipping_addresses(self, order_id):
+        status, data = await self.request("GET", f"/v2/orders/{order_id}/shipping_addresses")
+        if status == 200:
+            return data
+
+
+def run_bulk(method_name, arguments, **client_kwargs):
+    """Calls one client method for every entry in arguments and returns the results in order.
+    Each entry is a tuple of positional arguments, or a single value.
+
+        products = run_bulk("get_product", product_ids)
+    """
+    async def main():
+        async with BCAsyncClient(**client_kwargs) as client:
+            method = getattr(client, method_name)
+            return await client.gather(method(*x) if isinstance(x, tuple) else method(x) for x in arguments)
+
+    return asyncio.run(main())
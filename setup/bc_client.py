@@ -0,0 +1,117 @@
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from setup import creds
+
+# Big Commerce Client Settings
+# (connect, read) timeouts in seconds
+BC_TIMEOUT = (5, 30)
+BC_RETRIES = 3
+# Seconds before the first retry of a 5xx or dropped connection. Doubles on each retry.
+BC_BACKOFF = 1
+# Keep-alive connections held open to the API
+BC_POOL_SIZE = 16
+# Requests are held back until the window resets once this few are left
+BC_RATE_LIMIT_RESERVE = 5
+
+# Methods that are safe to send again after a 5xx or a dropped connection
+IDEMPOTENT_METHODS = {"GET", "PUT", "DELETE", "HEAD"}
+
+
+class RateLimit:
+    """Tracks Big Commerce rate limit headers and holds requests back when the quota runs low.
+    Each request counts against the last known quota as it is sent, so concurrent callers do not
+    overshoot it between responses."""
+
+    def __init__(self, reserve=BC_RATE_LIMIT_RESERVE):
+        self.reserve = reserve
+        self.requests_left = None
+        self.reset_at = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            if self.requests_left is not None and self.requests_left <= self.reserve:
+                delay = self.reset_at - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                self.requests_left = None
+            if self.requests_left is not None:
+                self.requests_left -= 1
+
+    def update(self, response):
+        headers = response.headers
+        with self.lock:
+            if "X-Rate-Limit-Requests-Left" in headers:
+                self.requests_left = int(headers["X-Rate-Limit-Requests-Left"])
+            if "X-Rate-Limit-Time-Reset-Ms" in headers:
+                self.reset_at = time.monotonic() + int(headers["X-Rate-Limit-Time-Reset-Ms"]) / 1000
+
+    def reset_delay(self):
+        with self.lock:
+            return max(0, self.reset_at - time.monotonic())
+
+
+class BCClient:
+    """Shared Big Commerce API client. Holds a keep-alive session with the auth headers, applies
+    timeouts, waits out the rate limit before it is hit, and retries 429 and 5xx responses."""
+
+    def __init__(self, store_hash=None, access_token=None, timeout=BC_TIMEOUT, retries=BC_RETRIES,
+                 backoff=BC_BACKOFF, pool_size=BC_POOL_SIZE):
+        store_hash = store_hash or creds.big_store_hash
+        self.base_url = f"https://api.bigcommerce.com/stores/{store_hash}"
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.rate_limit = RateLimit()
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.session.headers.update({
+            'X-Auth-Token': access_token or creds.big_access_token,
+            'Content-Type': 'application/json',
+            'Accept': 'application/json'
+        })
+
+    def request(self, method, path, **kwargs):
+        """Sends a request to a path under the store, such as /v2/orders/100. Returns the response."""
+        method = method.upper()
+        kwargs.setdefault("timeout", self.timeout)
+        for attempt in range(self.retries + 1):
+            self.rate_limit.wait()
+            try:
+                response = self.session.request(method, self.base_url + path, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as err:
+                if method not in IDEMPOTENT_METHODS or attempt == self.retries:
+                    raise
+                print(f"Big Commerce request failed ({err}). Retrying ({attempt + 1}/{self.retries})")
+                time.sleep(self.backoff * 2 ** attempt)
+                continue
+            self.rate_limit.update(response)
+            if attempt == self.retries:
+                return response
+            if response.status_code == 429:
+                # Not processed, so any method can be sent again once the window resets
+                time.sleep(self.rate_limit.reset_delay() or self.backoff)
+            elif response.status_code >= 500 and method in IDEMPOTENT_METHODS:
+                time.sleep(self.backoff * 2 ** attempt)
+            else:
+                return response
+            print(f"Big Commerce returned {response.status_code}. Retrying ({attempt + 1}/{self.retries})")
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request("PUT", path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request("DELETE", path, **kwargs)
+
+
+bc = BCClient()
@@ -1,17 +1,10 @@
 from setup import creds
-import requests
+from setup.bc_client import bc
+from setup.mirror_engine import MIRROR_MAX_AGE, mirror
 import json
 
 
 def bc_create_product(name, product_type, sku, weight, price):
-    url = f" https://api.bigcommerce.com/stores/{creds.big_store_hash}/v3/catalog/products"
-
-    headers = {
-        'X-Auth-Token': creds.big_access_token,
-        'Content-Type': 'application/json',
-        'Accept': 'application/json'
-    }
-
     payload = {
         'name': name,
         'type': product_type,
@@ -20,43 +13,39 @@ def bc_create_product(name, product_type, sku, weight, price):
         'price': price
     }
 
-    response = (requests.post(url, headers=headers, json=payload)).content
+    response = bc.post("/v3/catalog/products", json=payload).content
     response = json.loads(response)
     pretty_print = json.dumps(response, indent=4)
     return pretty_print
 
 
 def bc_update_product(product_id, payload, pretty=False):
-    url = f" https://api.bigcommerce.com/stores/{creds.big_store_hash}/v3/catalog/products/{product_id}"
-
-    headers = {
-        'X-Auth-Token': creds.big_access_token,
-        'Content-Type': 'application/json',
-        'Accept': 'application/json'
-    }
-
-    response = (requests.put(url, headers=headers, json=payload))
+    response = bc.put(f"/v3/catalog/products/{product_id}", json=payload)
     json_response = response.json()
     if pretty:
         pretty = response.content
         pretty = json.loads(pretty)
         pretty = json.dumps(pretty, indent=4)
         return pretty
-    if json_response['status'] != '404':
+    if json_response.get('status') != 404:
         return json_response
 
 
-def bc_get_product(product_id, pretty=False):
-    if product_id is not None:
-        url = f" https://api.bigcommerce.com/stores/{creds.big_store_hash}/v3/catalog/products/{product_id}"
+def bc_update_products(products):
+    """Updates up to 10 products in one request. Each product is a dict with an 'id'.
+    Returns the response."""
+    return bc.put("/v3/catalog/products", json=products)
 
-        headers = {
-            'X-Auth-Token': creds.big_access_token,
-            'Content-Type': 'application/json',
-            'Accept': 'application/json'
-        }
 
-        response = (requests.get(url, headers=headers))
+def bc_get_product(product_id, pretty=False, max_age=MIRROR_MAX_AGE):
+    """Reads from the local catalog mirror first if it has synced within max_age seconds.
+    Pass max_age=None to always call the API."""
+    if product_id is not None:
+        if max_age is not None and not pretty:
+            product = mirror.get_product(product_id, max_age)
+            if product is not None:
+                return {"data": product, "meta": {}}
+        response = bc.get(f"/v3/catalog/products/{product_id}")
         json_response = response.json()
         if pretty:
             pretty = response.content
@@ -70,17 +59,14 @@ def bc_get_product(product_id, pretty=False):
             return json_response
 
 
-def bc_get_variant(product_id, variant_id, pretty=False):
-    url = (f"https://api.bigcommerce.com/stores/{creds.big_store_hash}/v3/catalog/"
-           f"products/{product_id}/variants/{variant_id}")
-
-    headers = {
-        'X-Auth-Token': creds.big_access_token,
-        'Content-Type': 'application/json',
-        'Accept': 'application/json'
-    }
-
-    response = (requests.get(url, headers=headers))
+def bc_get_variant(product_id, variant_id, pretty=False, max_age=MIRROR_MAX_AGE):
+    """Reads from the local catalog mirror first. Pass max_age=None to always call the API."""
+    # Children without Big Commerce IDs yet skip the mirror
+    if max_age is not None and not pretty and product_id is not None and variant_id is not None:
+        variant = mirror.get_variant(product_id, variant_id, max_age)
+        if variant is not None:
+            return {"data": variant, "meta": {}}
+    response = bc.get(f"/v3/catalog/products/{product_id}/variants/{variant_id}")
     json_response = response.json()
     if pretty:
         pretty = response.content
@@ -88,3 +74,24 @@ def bc_get_variant(product_id, variant_id, pretty=False):
         pretty = json.dumps(pretty, indent=4)
         return pretty
     return json_response
+
+
+def bc_get_product_variants(product_id, max_age=MIRROR_MAX_AGE):
+    """Returns a list of all variants of a product, following pagination. Reads from the local
+    catalog mirror first. Pass max_age=None to always call the API."""
+    if max_age is not None and product_id is not None:
+        variants = mirror.get_product_variants(product_id, max_age)
+        if variants is not None:
+            return variants
+    variants = []
+    page = 1
+    while True:
+        response = bc.get(f"/v3/catalog/products/{product_id}/variants", params={'limit': 250, 'page': page})
+        if response.status_code != 200:
+            return variants
+        json_response = response.json()
+        variants += json_response['data']
+        pagination = json_response['meta']['pagination']
+        if pagination['current_page'] >= pagination['total_pages']:
+            return variants
+        page += 1
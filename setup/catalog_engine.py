@@ -0,0 +1,174 @@
+import threading
+import time
+
+from setup.query_engine import QueryEngine
+
+db = QueryEngine()
+
+# Catalog Snapshot Settings
+# Changed items are reloaded on read once this many seconds have passed since the last refresh
+CATALOG_REFRESH_INTERVAL = 60
+# The whole snapshot is rebuilt after this many seconds so deleted items drop out
+CATALOG_RELOAD_INTERVAL = 3600
+
+CATALOG_COLUMNS = ["item_no", "category", "subcategory", "binding_key", "is_parent", "is_ecomm",
+                   "variant_name", "price_1", "price_2", "quantity_available", "product_id", "variant_id",
+                   "descr", "long_descr", "web_title", "search_key", "brand", "botanical_name", "plant_type",
+                   "bloom_time", "flower_color"]
+# Columns with a secondary index
+CATALOG_INDEXES = ["category", "subcategory", "binding_key", "is_parent", "is_ecomm"]
+
+CATALOG_QUERY = """
+SELECT ITEM.ITEM_NO, ITEM.CATEG_COD, ITEM.SUBCAT_COD, ITEM.USR_PROF_ALPHA_16, ITEM.IS_ADM_TKT,
+ITEM.IS_ECOMM_ITEM, ITEM.USR_PROF_ALPHA_17, PRC.PRC_1, PRC.PRC_2, ISNULL(INV.QTY_AVAIL, 0),
+BC.PRODUCT_ID, BC.VARIANT_ID,
+ITEM.DESCR, ITEM.LONG_DESCR, ITEM.ADDL_DESCR_1, ITEM.USR_PROF_ALPHA_26, ITEM.PROF_COD_1, ITEM.PROF_ALPHA_1,
+ITEM.PROF_ALPHA_3, ITEM.USR_PROF_ALPHA_8, ITEM.USR_PROF_ALPHA_9
+FROM IM_ITEM ITEM
+LEFT OUTER JOIN IM_PRC PRC ON ITEM.ITEM_NO = PRC.ITEM_NO
+LEFT OUTER JOIN IM_INV INV ON ITEM.ITEM_NO = INV.ITEM_NO
+OUTER APPLY (
+    SELECT TOP 1 PRODUCT_ID, VARIANT_ID FROM CPI_BC_PROD
+    WHERE WEB_ID = '1' AND SKU = ITEM.ITEM_NO
+    ORDER BY PRODUCT_ID) BC
+"""
+
+CHANGED_ITEMS_QUERY = """
+SELECT ITEM_NO FROM IM_ITEM WHERE LST_MAINT_DT > ?
+UNION SELECT ITEM_NO FROM IM_PRC WHERE LST_MAINT_DT > ?
+UNION SELECT ITEM_NO FROM IM_INV WHERE LST_MAINT_DT > ?
+"""
+
+
+def index_key(value):
+    """SQL Server compares codes without case or trailing spaces, so index keys do the same"""
+    if value is None:
+        return None
+    return str(value).rstrip().upper()
+
+
+class CatalogSnapshot:
+    """In-memory copy of the item, price, inventory and Big Commerce ID tables. Each column is held as
+    a list, with a position per item number and secondary indexes of {value: set of positions}.
+    Reads refresh the items changed since the last load once the refresh interval has passed."""
+
+    def __init__(self, refresh_interval=CATALOG_REFRESH_INTERVAL, reload_interval=CATALOG_RELOAD_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self.reload_interval = reload_interval
+        self.lock = threading.RLock()
+        self.columns = {x: [] for x in CATALOG_COLUMNS}
+        self.positions = {}
+        self.indexes = {x: {} for x in CATALOG_INDEXES}
+        self.loaded_at = None
+        self.last_refresh = 0
+        self.last_reload = 0
+        # Bumped on every full load. Positions set since then are listed in updates, so
+        # indexes built on top of the snapshot can catch up incrementally.
+        self.generation = 0
+        self.updates = []
+
+    def reset(self):
+        self.columns = {x: [] for x in CATALOG_COLUMNS}
+        self.positions = {}
+        self.indexes = {x: {} for x in CATALOG_INDEXES}
+        self.generation += 1
+        self.updates = []
+
+    def set_row(self, row):
+        key = index_key(row[0])
+        position = self.positions.get(key)
+        if position is None:
+            position = len(self.columns["item_no"])
+            self.positions[key] = position
+            for column in CATALOG_COLUMNS:
+                self.columns[column].append(None)
+        else:
+            for column in CATALOG_INDEXES:
+                old = index_key(self.columns[column][position])
+                self.indexes[column].get(old, set()).discard(position)
+        for column, value in zip(CATALOG_COLUMNS, row):
+            self.columns[column][position] = value
+        for column in CATALOG_INDEXES:
+            self.indexes[column].setdefault(index_key(self.columns[column][position]), set()).add(position)
+        self.updates.append(position)
+
+    def load(self):
+        """Loads the whole catalog"""
+        load_time = db.query_db("SELECT GETDATE()")[0][0]
+        with self.lock:
+            self.reset()
+            for row in db.query_stream(CATALOG_QUERY):
+                self.set_row(row)
+            self.loaded_at = load_time
+            self.last_refresh = self.last_reload = time.monotonic()
+
+    def refresh(self):
+        """Reloads the items whose item, price or inventory record changed since the last load"""
+        load_time = db.query_db("SELECT GETDATE()")[0][0]
+        response = db.query_db(CHANGED_ITEMS_QUERY, (self.loaded_at,) * 3)
+        with self.lock:
+            if response is not None:
+                item_nos = [x[0] for x in response]
+                for i in range(0, len(item_nos), 1000):
+                    chunk = item_nos[i:i + 1000]
+                    placeholders = ", ".join("?" for x in chunk)
+                    query = f"{CATALOG_QUERY} WHERE ITEM.ITEM_NO IN ({placeholders})"
+                    for row in db.query_stream(query, tuple(chunk)):
+                        self.set_row(row)
+            self.loaded_at = load_time
+            self.last_refresh = time.monotonic()
+
+    def ensure_fresh(self):
+        with self.lock:
+            now = time.monotonic()
+            if self.loaded_at is None or now - self.last_reload >= self.reload_interval:
+                self.load()
+            elif now - self.last_refresh >= self.refresh_interval:
+                self.refresh()
+
+    def find(self, **filters):
+        """Returns the positions matching every indexed column filter"""
+        result = None
+        for column, value in filters.items():
+            positions = self.indexes[column].get(index_key(value), set())
+            result = set(positions) if result is None else result & positions
+            if not result:
+                return set()
+        return result
+
+    def values(self, positions, *columns):
+        """Returns rows of the given columns for a set of positions, ordered by item number"""
+        rows = sorted(positions, key=lambda x: self.columns["item_no"][x])
+        if len(columns) == 1:
+            return [self.columns[columns[0]][x] for x in rows]
+        return [[self.columns[c][x] for c in columns] for x in rows]
+
+    def get(self, item_no, column):
+        position = self.positions.get(index_key(item_no))
+        if position is not None:
+            return self.columns[column][position]
+
+    def items(self, column="item_no", **filters):
+        """Returns one column for the items matching the filters"""
+        self.ensure_fresh()
+        with self.lock:
+            return self.values(self.find(**filters), column)
+
+    def lookup(self, item_no, column):
+        self.ensure_fresh()
+        with self.lock:
+            return self.get(item_no, column)
+
+    def binding_ids(self):
+        self.ensure_fresh()
+        with self.lock:
+            keys = self.indexes["binding_key"]
+            return sorted(self.columns["binding_key"][min(v)] for k, v in keys.items() if k is not None and v)
+
+    def variant_names(self, binding_key):
+        self.ensure_fresh()
+        with self.lock:
+            return self.values(self.find(binding_key=binding_key), "item_no", "variant_name")
+
+
+catalog = CatalogSnapshot()
@@ -1,5 +1,4 @@
-from setup import creds
-import requests
+from setup.bc_client import bc
 import secrets
 import string
 import json
@@ -11,14 +10,6 @@ from dateutil.relativedelta import relativedelta
 def bc_create_coupon(name, type, amount, min_purchase, code, max_uses_per_customer,
                      max_uses, expiration, enabled=True, pretty=False):
 
-    url = f"https://api.bigcommerce.com/stores/{creds.big_store_hash}/v2/coupons"
-
-    headers = {
-        'X-Auth-Token': creds.big_access_token,
-        'Content-Type': 'application/json',
-        'Accept': 'application/json'
-    }
-
     payload = {
         'name': name,
         'type': type,
@@ -34,7 +25,7 @@ def bc_create_coupon(name, type, amount, min_purchase, code, max_uses_per_custom
         },
         'expires': expiration
     }
-    response = requests.post(url=url, headers=headers, json=payload)
+    response = bc.post("/v2/coupons", json=payload)
     json_response = response.json()
     if pretty:
         pretty = response.content
@@ -0,0 +1,43 @@
+import csv
+import threading
+
+from setup import log_engine
+
+
+class DedupIndex:
+    """Hash set of the keys in a CSV log for constant time duplicate checks. Built from the existing
+    file once at startup and kept in sync by appending rows through add()."""
+
+    def __init__(self, log_location, columns, key_columns):
+        self.log_location = log_location
+        self.columns = list(columns)
+        self.key_columns = list(key_columns)
+        self.key_positions = [self.columns.index(x) for x in self.key_columns]
+        self.keys = set()
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """Rebuilds the index from the log file"""
+        keys = set()
+        try:
+            with open(self.log_location, "r", newline="", encoding="utf-8", errors="replace") as file:
+                for row in csv.DictReader(file):
+                    keys.add(tuple(str(row.get(x) or "") for x in self.key_columns))
+        except FileNotFoundError:
+            pass
+        with self.lock:
+            self.keys = keys
+
+    def contains(self, *key):
+        return tuple(str(x) for x in key) in self.keys
+
+    def add(self, row):
+        """Appends row to the log if its key is not already on file. Returns False for duplicates."""
+        key = tuple(str(row[x]) for x in self.key_positions)
+        with self.lock:
+            if key in self.keys:
+                return False
+            self.keys.add(key)
+        log_engine.write_log_row(row, self.columns, self.log_location)
+        return True
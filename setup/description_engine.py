@@ -0,0 +1,106 @@
+import csv
+import os
+import re
+
+from setup import creds
+from setup.query_engine import QueryEngine
+
+db = QueryEngine()
+
+DESCRIPTION_COLUMNS = ["item_no", "html_description"]
+# Cleaned descriptions are written back to Counterpoint in batches of this size. Each row uses two
+# of the 2100 parameters per statement.
+WRITE_BACK_BATCH_SIZE = 500
+
+# Anything before the first <p> tag is left over from the old editor
+FIRST_PARAGRAPH = re.compile(r"<p>")
+LINE_BREAKS = re.compile(r"[\r\n]|&nbsp;")
+
+
+def clean_description(html):
+    """Removes line breaks and non-breaking spaces"""
+    return LINE_BREAKS.sub("", html.strip())
+
+
+def trim_before_paragraph(html):
+    """Returns the description from the first <p> tag on, or None if it has none"""
+    match = FIRST_PARAGRAPH.search(html)
+    if match is not None:
+        return html[match.start():]
+
+
+def stream_descriptions(where="HTML_DESCR IS NOT NULL"):
+    """Yields (item_no, html_description) from EC_ITEM_DESCR"""
+    query = f"""
+    SELECT ITEM_NO, HTML_DESCR
+    FROM EC_ITEM_DESCR
+    WHERE {where}
+    """
+    for x in db.query_stream(query):
+        if x[1] is not None:
+            yield x[0], x[1]
+
+
+def write_descriptions(rows, log_location=None):
+    """Writes (item_no, html_description) rows through one CSV writer. Returns the row count."""
+    if log_location is None:
+        log_location = creds.description_log
+    count = 0
+    with open(log_location, "a", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file, lineterminator=os.linesep)
+        if file.tell() == 0:
+            writer.writerow(DESCRIPTION_COLUMNS)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def write_back(rows, batch_size=WRITE_BACK_BATCH_SIZE):
+    """Updates EC_ITEM_DESCR with cleaned descriptions, one UPDATE joined to a VALUES list per batch.
+    Takes a list of (item_no, html_description) that has been read in full, so no SELECT on the table
+    is still open while it is written. Returns the number of items updated."""
+    updated_count = 0
+    for i in range(0, len(rows), batch_size):
+        batch = rows[i:i + batch_size]
+        placeholders = ", ".join("(?, ?)" for x in batch)
+        query = f"""
+        SET NOCOUNT ON
+        DECLARE @CHANGES TABLE (ITEM_NO VARCHAR(50))
+        UPDATE DESCR
+        SET DESCR.HTML_DESCR = CHANGES.HTML_DESCR
+        OUTPUT CHANGES.ITEM_NO INTO @CHANGES
+        FROM EC_ITEM_DESCR DESCR
+        INNER JOIN (VALUES {placeholders}) CHANGES (ITEM_NO, HTML_DESCR) ON DESCR.ITEM_NO = CHANGES.ITEM_NO
+        SELECT ITEM_NO FROM @CHANGES
+        """
+        params = []
+        for item_no, html in batch:
+            params.extend((item_no, html))
+        response = db.query_returning(query, tuple(params))
+        if isinstance(response, dict):
+            print(f"Failed to update {len(batch)} descriptions. {response['message']}")
+            continue
+        updated = {x[0] for x in response}
+        updated_count += len(updated)
+        for item_no, html in batch:
+            if item_no not in updated:
+                print(f"{item_no}: failed to update description. No matching item")
+    return updated_count
+
+
+def fix_html_trash(write_back_to_cp=False, log_location=None):
+    """Removes trash before the first <p> tag of descriptions that contain a <div>"""
+    rows = ((item_no, trim_before_paragraph(html)) for item_no, html in stream_descriptions("HTML_DESCR like '%<div%'"))
+    rows = ((item_no, clean_description(html)) for item_no, html in rows if html is not None)
+    if write_back_to_cp:
+        # The read is finished before any UPDATE is sent, so the streaming SELECT cannot block it
+        rows = list(rows)
+        write_back(rows)
+    return write_descriptions(rows, log_location)
+
+
+def export_html_descr(log_location=None):
+    """Exports all cleaned descriptions to the description log in one pass"""
+    rows = ((item_no, clean_description(html)) for item_no, html in stream_descriptions())
+    return write_descriptions(rows, log_location)
@@ -1,31 +1,256 @@
-import pandas
+import atexit
+import csv
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
 
+# Log Sink Settings
+# Rows are written once this many are waiting, or after the flush interval (seconds) has passed
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 2
+# Local file that holds rows while the share drive is unreachable
+SPOOL_LOCATION = "./log_spool.jsonl"
+# Least recently used handles are closed past this count
+MAX_OPEN_HANDLES = 32
+
+
+class LogWriter:
+    """Appends rows to CSV logs on the share drive. Keeps one open file handle per log location
+    and decides on the header with a stat of the file instead of re-reading it."""
+
+    def __init__(self, max_open_handles=MAX_OPEN_HANDLES):
+        self.handles = OrderedDict()
+        self.max_open_handles = max_open_handles
+        self.lock = threading.Lock()
+
+    def get_handle(self, log_location, columns):
+        handle = self.handles.get(log_location)
+        if handle is not None:
+            self.handles.move_to_end(log_location)
+        # Looks for file. If it has been deleted, it will recreate.
+        if handle is not None and not os.path.exists(log_location):
+            handle.close()
+            handle = None
+        if handle is None:
+            handle = open(log_location, "a", newline="", encoding="utf-8")
+            self.handles[log_location] = handle
+            if len(self.handles) > self.max_open_handles:
+                self.handles.popitem(last=False)[1].close()
+            # New or empty file gets a header
+            if handle.tell() == 0:
+                csv.writer(handle, lineterminator=os.linesep).writerow(columns)
+        return handle
+
+    def write_rows(self, rows, columns, log_location):
+        with self.lock:
+            try:
+                handle = self.get_handle(log_location, columns)
+                csv.writer(handle, lineterminator=os.linesep).writerows(rows)
+                handle.flush()
+            except OSError:
+                # Drop the handle so the next write reopens the file
+                handle = self.handles.pop(log_location, None)
+                if handle is not None:
+                    try:
+                        handle.close()
+                    except OSError:
+                        pass
+                raise
+
+    def close(self, log_location=None):
+        """Closes the handle for one log location, or all handles if no location is given"""
+        with self.lock:
+            locations = [log_location] if log_location is not None else list(self.handles)
+            for location in locations:
+                handle = self.handles.pop(location, None)
+                if handle is not None:
+                    handle.close()
+
+
+class LogSink:
+    """Queues log rows and writes them from a background thread. Rows are grouped per log location
+    and flushed on batch size or time. Rows that cannot reach the share drive are spooled to a local
+    file and replayed on the next flush."""
+
+    def __init__(self, log_writer, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL,
+                 spool_location=SPOOL_LOCATION):
+        self.writer = log_writer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spool_location = spool_location
+        self.queue = queue.Queue()
+        self.pending = OrderedDict()
+        self.pending_count = 0
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def put(self, rows, columns, log_location):
+        """Queues rows for writing and returns immediately"""
+        self.start()
+        self.queue.put((log_location, list(columns), rows))
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name="log_sink", daemon=True)
+                self.thread.start()
+
+    def flush(self, timeout=None):
+        """Blocks until everything queued before this call has been written or spooled"""
+        if self.thread is None or not self.thread.is_alive():
+            return
+        done = threading.Event()
+        self.queue.put(done)
+        # Polls so a writer thread that has died does not leave the caller waiting forever
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not done.wait(0.5):
+            if not self.thread.is_alive():
+                return
+            if deadline is not None and time.monotonic() >= deadline:
+                return
+
+    def shutdown(self, timeout=10):
+        """Writes out everything still queued and stops the writer thread"""
+        if self.thread is None or not self.thread.is_alive():
+            return
+        self.queue.put(None)
+        self.thread.join(timeout)
+
+    def run(self):
+        last_flush = time.monotonic()
+        while True:
+            wait = max(0, self.flush_interval - (time.monotonic() - last_flush))
+            try:
+                entry = self.queue.get(timeout=wait)
+            except queue.Empty:
+                entry = ()
+
+            if entry is None or isinstance(entry, threading.Event):
+                self.safe_write_pending()
+                last_flush = time.monotonic()
+                if entry is None:
+                    return
+                entry.set()
+                continue
+
+            if entry:
+                log_location, columns, rows = entry
+                self.pending.setdefault(log_location, [columns, []])[1].extend(rows)
+                self.pending_count += len(rows)
+
+            if self.pending_count >= self.batch_size or time.monotonic() - last_flush >= self.flush_interval:
+                self.safe_write_pending()
+                last_flush = time.monotonic()
+
+    def safe_write_pending(self):
+        """Writes pending rows without letting an error stop the writer thread. Rows that could not
+        be written are kept pending for the next flush."""
+        try:
+            self.write_pending()
+        except Exception as err:
+            print(f"Log sink error: {err}. Keeping {self.pending_count} rows for the next flush.")
+
+    def write_pending(self):
+        batches = self.read_spool()
+        batches.extend((location, columns, rows) for location, (columns, rows) in self.pending.items())
+
+        failed = []
+        for log_location, columns, rows in batches:
+            try:
+                self.writer.write_rows(rows, columns, log_location)
+            except OSError as err:
+                print(f"Log share unreachable ({log_location}): {err}. Spooling {len(rows)} rows.")
+                failed.append((log_location, columns, rows))
+            except Exception as err:
+                # Retrying would fail the same way every flush
+                print(f"Log rows for {log_location} could not be written: {err}. "
+                      f"Moving {len(rows)} rows to {self.spool_location}.bad")
+                entry = {"log_location": log_location, "columns": columns, "rows": rows}
+                self.quarantine([json.dumps(entry, default=str)])
+        self.write_spool(failed)
+        # Cleared only once every row is written or spooled, so an error above keeps them pending
+        self.pending = OrderedDict()
+        self.pending_count = 0
+
+    def read_spool(self):
+        if not os.path.exists(self.spool_location):
+            return []
+        batches = []
+        bad_lines = []
+        with open(self.spool_location, "r", encoding="utf-8") as file:
+            for line in file:
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                    batches.append((entry["log_location"], entry["columns"], entry["rows"]))
+                except (ValueError, KeyError, TypeError):
+                    bad_lines.append(line)
+        if bad_lines:
+            print(f"Log spool: moving {len(bad_lines)} unreadable lines to {self.spool_location}.bad")
+            self.quarantine(bad_lines)
+        return batches
+
+    def quarantine(self, lines):
+        """Sets spool lines aside for inspection instead of failing every later flush"""
+        with open(self.spool_location + ".bad", "a", encoding="utf-8") as file:
+            file.writelines(x.rstrip("\n") + "\n" for x in lines)
+
+    def write_spool(self, batches):
+        if not batches:
+            if os.path.exists(self.spool_location):
+                os.remove(self.spool_location)
+            return
+        # Rewritten in full, since read_spool has already taken the previous contents. Written to a
+        # temporary file and swapped in so a crash mid-write leaves the old spool intact.
+        temp_location = self.spool_location + ".tmp"
+        with open(temp_location, "w", encoding="utf-8") as file:
+            for log_location, columns, rows in batches:
+                entry = {"log_location": log_location, "columns": columns, "rows": rows}
+                file.write(json.dumps(entry, default=str) + "\n")
+        os.replace(temp_location, self.spool_location)
+
+
+writer = LogWriter()
+sink = LogSink(writer)
+
+
+def shutdown():
+    sink.shutdown()
+    writer.close()
+
+
+atexit.register(shutdown)
+
 
 def create_product_log(item_no, product_name, qty_avail, status_1_col_name,
                        status_1_data, log_location, status_2_col_name="", status_2_data=""):
-    # Two Status
-    if status_2_col_name == "":
-        log_data = [[str(datetime.now())[:-7], item_no, product_name, qty_avail, status_1_data]]
-
-        df = pandas.DataFrame(log_data, columns=["date", "item_no", "product_name",
-                                                 "qty_avail", status_1_col_name])
     # One Status
+    if status_2_col_name == "":
+        log_data = [str(datetime.now())[:-7], item_no, product_name, qty_avail, status_1_data]
+        columns = ["date", "item_no", "product_name", "qty_avail", status_1_col_name]
+    # Two Status
     else:
-        log_data = [[str(datetime.now())[:-7], item_no, product_name, qty_avail, status_1_data, status_2_data]]
+        log_data = [str(datetime.now())[:-7], item_no, product_name, qty_avail, status_1_data, status_2_data]
+        columns = ["date", "item_no", "product_name", "qty_avail", status_1_col_name, status_2_col_name]
 
-        df = pandas.DataFrame(log_data, columns=["date", "item_no", "product_name",
-                                                 "qty_avail", status_1_col_name, status_2_col_name])
+    write_log_row(log_data, columns, log_location)
 
-    write_log(df, log_location)
+
+def write_log_row(row, columns, log_location):
+    """Queues a single row for the CSV log on share location"""
+    sink.put([row], columns, log_location)
+
+
+def write_log_rows(rows, columns, log_location):
+    """Queues many rows for the CSV log on share location"""
+    sink.put(list(rows), columns, log_location)
 
 
 def write_log(dataframe, log_location):
-    """Writes CSV log to share location"""
-    # Looks for file. If it has been deleted, it will recreate.
-    try:
-        pandas.read_csv(log_location)
-    except FileNotFoundError:
-        dataframe.to_csv(log_location, mode='a', header=True, index=False)
-    else:
-        dataframe.to_csv(log_location, mode='a', header=False, index=False)
+    """Queues a dataframe for the CSV log on share location"""
+    sink.put(dataframe.values.tolist(), dataframe.columns, log_location)
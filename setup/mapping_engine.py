@@ -0,0 +1,99 @@
+import threading
+import time
+
+from setup.catalog_engine import index_key
+from setup.query_engine import QueryEngine
+
+db = QueryEngine()
+
+# Seconds between background reloads of the Big Commerce ID tables
+BC_ID_REFRESH_INTERVAL = 300
+
+
+class BCIdMap:
+    """Big Commerce product and variant IDs for every SKU and binding key on web store 1, loaded from
+    CPI_BC_PRODUCTS and CPI_BC_PROD. A background thread reloads both tables on a timer.
+    Keys missing from the tables are looked up once and remembered until the next reload."""
+
+    def __init__(self, refresh_interval=BC_ID_REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self.lock = threading.Lock()
+        # item number or binding key -> product ID
+        self.product_ids = {}
+        # SKU -> (product ID, variant ID)
+        self.variant_ids = {}
+        self.loaded = False
+        self.thread = None
+
+    def refresh(self):
+        """Reloads both tables"""
+        product_ids = {}
+        # Newest product record wins, as in lookup_product_id
+        query = """
+        SELECT ITEM_NO, PRODUCT_ID FROM CPI_BC_PRODUCTS
+        WHERE WEB_ID = '1'
+        ORDER BY CREATE_DATE
+        """
+        for x in db.query_stream(query):
+            product_ids[index_key(x[0])] = x[1]
+        variant_ids = {}
+        # Lowest product ID wins, as in lookup_variant_ids
+        query = """
+        SELECT SKU, PRODUCT_ID, VARIANT_ID FROM CPI_BC_PROD
+        WHERE WEB_ID = '1'
+        ORDER BY PRODUCT_ID
+        """
+        for x in db.query_stream(query):
+            variant_ids.setdefault(index_key(x[0]), (x[1], x[2]))
+        with self.lock:
+            self.product_ids = product_ids
+            self.variant_ids = variant_ids
+            self.loaded = True
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.thread = threading.Thread(target=self.run, name="bc_id_refresh", daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            try:
+                self.refresh()
+            except Exception as err:
+                print(f"Big Commerce ID refresh failed: {err}")
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            self.refresh()
+            if self.refresh_interval:
+                self.start()
+
+    def get(self, mapping, key, lookup):
+        self.ensure_loaded()
+        key = index_key(key)
+        with self.lock:
+            table = getattr(self, mapping)
+            if key in table:
+                return table[key]
+        value = lookup()
+        with self.lock:
+            getattr(self, mapping).setdefault(key, value)
+        return value
+
+    def product_id(self, item_no):
+        """Returns the Big Commerce product ID for an item number or binding key"""
+        if item_no is None:
+            return
+        return self.get("product_ids", item_no, lambda: db.lookup_product_id(item_no))
+
+    def variant_ids_for(self, sku):
+        """Returns (product ID, variant ID) for a SKU"""
+        if sku is None:
+            return
+        return self.get("variant_ids", sku, lambda: db.lookup_variant_ids(sku))
+
+
+bc_ids = BCIdMap()
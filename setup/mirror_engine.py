@@ -0,0 +1,208 @@
+import json
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+from setup.bc_client import bc
+
+# Big Commerce Catalog Mirror Settings
+MIRROR_LOCATION = "./bc_catalog.sqlite3"
+# Default number of seconds reads will accept since the last sync. Older mirrors are not read.
+MIRROR_MAX_AGE = 300
+# A full sync runs after this many seconds so deleted products drop out
+MIRROR_FULL_SYNC_INTERVAL = 86400
+MIRROR_PAGE_SIZE = 250
+# Seconds after a failed sync before reads start another
+MIRROR_RETRY_INTERVAL = 60
+
+
+class CatalogMirror:
+    """Local SQLite copy of the Big Commerce catalog. The first sync pages through every product with
+    its variants. Later syncs only request products modified since the newest date_modified seen.
+    Reads take a max_age in seconds. If the last sync is older than that, the read returns None so the
+    caller goes to the API, and a sync is started in a background thread."""
+
+    def __init__(self, location=MIRROR_LOCATION, full_sync_interval=MIRROR_FULL_SYNC_INTERVAL,
+                 retry_interval=MIRROR_RETRY_INTERVAL):
+        self.location = location
+        self.full_sync_interval = full_sync_interval
+        self.retry_interval = retry_interval
+        self.lock = threading.Lock()
+        self.tables_created = False
+
+    def connect(self):
+        if not self.tables_created:
+            self.create_tables()
+            self.tables_created = True
+        return closing(sqlite3.connect(self.location))
+
+    def create_tables(self):
+        with closing(sqlite3.connect(self.location)) as connection, connection:
+            connection.execute("""
+            CREATE TABLE IF NOT EXISTS PRODUCTS (
+            PRODUCT_ID INTEGER PRIMARY KEY, SKU TEXT, DATE_MODIFIED TEXT, DATA TEXT NOT NULL)
+            """)
+            connection.execute("""
+            CREATE TABLE IF NOT EXISTS VARIANTS (
+            VARIANT_ID INTEGER PRIMARY KEY, PRODUCT_ID INTEGER NOT NULL, SKU TEXT, DATA TEXT NOT NULL)
+            """)
+            connection.execute("CREATE INDEX IF NOT EXISTS VARIANTS_PRODUCT ON VARIANTS (PRODUCT_ID)")
+            connection.execute("CREATE TABLE IF NOT EXISTS SYNC_STATE (NAME TEXT PRIMARY KEY, VALUE TEXT)")
+
+    def get_state(self, connection, name):
+        row = connection.execute("SELECT VALUE FROM SYNC_STATE WHERE NAME = ?", (name,)).fetchone()
+        if row is not None:
+            return row[0]
+
+    def set_state(self, connection, name, value):
+        connection.execute("INSERT OR REPLACE INTO SYNC_STATE (NAME, VALUE) VALUES (?, ?)", (name, str(value)))
+
+    def save_products(self, connection, products):
+        for product in products:
+            variants = product.get("variants") or []
+            connection.execute("INSERT OR REPLACE INTO PRODUCTS (PRODUCT_ID, SKU, DATE_MODIFIED, DATA) "
+                               "VALUES (?, ?, ?, ?)",
+                               (product["id"], product.get("sku"), product.get("date_modified"), json.dumps(product)))
+            connection.execute("DELETE FROM VARIANTS WHERE PRODUCT_ID = ?", (product["id"],))
+            connection.executemany("INSERT OR REPLACE INTO VARIANTS (VARIANT_ID, PRODUCT_ID, SKU, DATA) "
+                                   "VALUES (?, ?, ?, ?)",
+                                   [(x["id"], product["id"], x.get("sku"), json.dumps(x)) for x in variants])
+
+    def sync(self, full=False):
+        """Pages through products with their variants. Only products modified since the last sync
+        are requested unless full is True or the last full sync is too old."""
+        with self.lock:
+            return self.run_sync(full)
+
+    def run_sync(self, full=False):
+        """Runs a sync. The caller holds the lock. Failures are recorded so reads back off."""
+        try:
+            synced = self.fetch_changes(full)
+        except Exception:
+            self.record_failure()
+            raise
+        if not synced:
+            self.record_failure()
+        return synced
+
+    def record_failure(self):
+        with self.connect() as connection, connection:
+            self.set_state(connection, "last_failed_sync", time.time())
+
+    def fetch_changes(self, full=False):
+        with self.connect() as connection:
+            last_full_sync = float(self.get_state(connection, "last_full_sync") or 0)
+            high_water_mark = self.get_state(connection, "date_modified")
+            full = full or high_water_mark is None or time.time() - last_full_sync >= self.full_sync_interval
+            started = time.time()
+            params = {"include": "variants", "limit": MIRROR_PAGE_SIZE, "page": 1}
+            if not full:
+                params["date_modified:min"] = high_water_mark
+            seen = []
+            product_ids = []
+            while True:
+                response = bc.get("/v3/catalog/products", params=params)
+                if response.status_code != 200:
+                    print(f"Catalog mirror sync failed ({response.status_code}) on page {params['page']}")
+                    return False
+                json_response = response.json()
+                products = json_response["data"]
+                with connection:
+                    self.save_products(connection, products)
+                product_ids += [x["id"] for x in products]
+                seen += [x["date_modified"] for x in products if x.get("date_modified")]
+                pagination = json_response["meta"]["pagination"]
+                if pagination["current_page"] >= pagination["total_pages"]:
+                    break
+                params["page"] += 1
+            with connection:
+                if full:
+                    # Products no longer in Big Commerce
+                    connection.execute("CREATE TEMP TABLE IF NOT EXISTS SEEN (PRODUCT_ID INTEGER PRIMARY KEY)")
+                    connection.execute("DELETE FROM SEEN")
+                    connection.executemany("INSERT OR IGNORE INTO SEEN VALUES (?)", [(x,) for x in product_ids])
+                    connection.execute("DELETE FROM PRODUCTS WHERE PRODUCT_ID NOT IN (SELECT PRODUCT_ID FROM SEEN)")
+                    connection.execute("DELETE FROM VARIANTS WHERE PRODUCT_ID NOT IN (SELECT PRODUCT_ID FROM SEEN)")
+                if seen:
+                    # BC dates share one format and time zone, so the newest sorts last
+                    self.set_state(connection, "date_modified", max(seen + [high_water_mark or ""]))
+                elif high_water_mark is None:
+                    self.set_state(connection, "date_modified", "1970-01-01T00:00:00+00:00")
+                self.set_state(connection, "last_sync", started)
+                if full:
+                    self.set_state(connection, "last_full_sync", started)
+            return True
+
+    def ensure_fresh(self, max_age):
+        """Returns True if the mirror has synced within max_age seconds. Otherwise starts a background
+        sync and returns False without waiting for it."""
+        with self.connect() as connection:
+            last_sync = float(self.get_state(connection, "last_sync") or 0)
+        if time.time() - last_sync <= max_age:
+            return True
+        self.start_sync()
+        return False
+
+    def start_sync(self):
+        """Starts a sync in a background thread, unless one is running or the last one failed within
+        the retry interval"""
+        if not self.lock.acquire(blocking=False):
+            return
+        try:
+            with self.connect() as connection:
+                last_failed_sync = float(self.get_state(connection, "last_failed_sync") or 0)
+            if time.time() - last_failed_sync < self.retry_interval:
+                self.lock.release()
+                return
+            threading.Thread(target=self.background_sync, name="catalog_mirror_sync", daemon=True).start()
+        except BaseException:
+            self.lock.release()
+            raise
+
+    def background_sync(self):
+        """Runs a sync for start_sync, which hands over the lock"""
+        try:
+            self.run_sync()
+        except Exception as err:
+            print(f"Catalog mirror sync failed: {err}")
+        finally:
+            self.lock.release()
+
+    def get_product(self, product_id, max_age=MIRROR_MAX_AGE):
+        """Returns the product with its variants, or None if it is not in the mirror"""
+        if product_id is None:
+            return None
+        if not self.ensure_fresh(max_age):
+            return None
+        with self.connect() as connection:
+            row = connection.execute("SELECT DATA FROM PRODUCTS WHERE PRODUCT_ID = ?", (int(product_id),)).fetchone()
+        if row is not None:
+            return json.loads(row[0])
+
+    def get_variant(self, product_id, variant_id, max_age=MIRROR_MAX_AGE):
+        if product_id is None or variant_id is None:
+            return None
+        if not self.ensure_fresh(max_age):
+            return None
+        with self.connect() as connection:
+            row = connection.execute("SELECT DATA FROM VARIANTS WHERE VARIANT_ID = ? AND PRODUCT_ID = ?",
+                                     (int(variant_id), int(product_id))).fetchone()
+        if row is not None:
+            return json.loads(row[0])
+
+    def get_product_variants(self, product_id, max_age=MIRROR_MAX_AGE):
+        """Returns the variants of a product, or None if the product is not in the mirror"""
+        if product_id is None:
+            return None
+        if not self.ensure_fresh(max_age):
+            return None
+        with self.connect() as connection:
+            if connection.execute("SELECT 1 FROM PRODUCTS WHERE PRODUCT_ID = ?", (int(product_id),)).fetchone() is None:
+                return None
+            rows = connection.execute("SELECT DATA FROM VARIANTS WHERE PRODUCT_ID = ? ORDER BY VARIANT_ID",
+                                      (int(product_id),)).fetchall()
+        return [json.loads(x[0]) for x in rows]
+
+
+mirror = CatalogMirror()
@@ -0,0 +1,74 @@
+from datetime import datetime
+
+from setup.log_engine import write_log_rows
+from setup.query_engine import QueryEngine
+
+db = QueryEngine()
+
+# A VALUES list holds at most 1000 rows, and each row uses two of the 2100 parameters per statement
+MUTATION_CHUNK_SIZE = 1000
+
+PRODUCT_LOG_COLUMNS = ["date", "item_no", "product_name", "qty_avail"]
+
+
+def update_items(column, values, value_type, key_column="ITEM_NO", condition="1=1",
+                 chunk_size=MUTATION_CHUNK_SIZE):
+    """Sets one IM_ITEM column for many items with a single UPDATE per chunk. Takes {key: value},
+    where the key is matched against key_column. The new values are read back through the OUTPUT
+    clause, so no follow-up SELECT is needed.
+    Returns (changes, errors): changes is a list of dicts with key, item_no, old_value, new_value,
+    long_descr and quantity_available. errors is {key: {"code", "message"}} for keys that were not updated."""
+    items = list(values.items())
+    maintenance_date = str(datetime.now())[:-6] + "000"
+    changes = []
+    errors = {}
+    for i in range(0, len(items), chunk_size):
+        chunk = items[i:i + chunk_size]
+        placeholders = ", ".join("(?, ?)" for x in chunk)
+        # OUTPUT goes into a table variable since IM_ITEM has triggers
+        query = f"""
+        SET NOCOUNT ON
+        DECLARE @CHANGES TABLE (KEY_VALUE VARCHAR(50), ITEM_NO VARCHAR(50), OLD_VALUE {value_type},
+        NEW_VALUE {value_type}, LONG_DESCR VARCHAR(100), QTY_AVAIL DECIMAL(15, 4))
+        UPDATE ITEM
+        SET ITEM.{column} = CAST(CHANGES.VALUE AS {value_type}), ITEM.LST_MAINT_DT = ?
+        OUTPUT CHANGES.KEY_VALUE, inserted.ITEM_NO, deleted.{column}, inserted.{column}, inserted.LONG_DESCR,
+        ISNULL(INV.QTY_AVAIL, 0) INTO @CHANGES
+        FROM IM_ITEM ITEM
+        INNER JOIN (VALUES {placeholders}) CHANGES (KEY_VALUE, VALUE) ON ITEM.{key_column} = CHANGES.KEY_VALUE
+        LEFT OUTER JOIN IM_INV INV ON ITEM.ITEM_NO = INV.ITEM_NO
+        WHERE {condition}
+        SELECT KEY_VALUE, ITEM_NO, OLD_VALUE, NEW_VALUE, LONG_DESCR, QTY_AVAIL FROM @CHANGES
+        """
+        params = [maintenance_date]
+        for key, value in chunk:
+            params.extend((key, value))
+        response = db.query_returning(query, tuple(params))
+        if isinstance(response, dict):
+            for key, value in chunk:
+                errors[key] = response
+            continue
+        updated = set()
+        for x in response:
+            updated.add(x[0])
+            changes.append({"key": x[0], "item_no": x[1], "old_value": x[2], "new_value": x[3],
+                            "long_descr": x[4], "quantity_available": x[5]})
+        for key, value in chunk:
+            if key not in updated:
+                errors[key] = {"code": 404, "message": "No matching item"}
+    return changes, errors
+
+
+def log_changes(changes, errors, values, status_col_name, log_location):
+    """Writes one log row per change and failure in a single batch"""
+    now = str(datetime.now())[:-7]
+    columns = PRODUCT_LOG_COLUMNS + [status_col_name, "Message"]
+    rows = []
+    for x in changes:
+        rows.append([now, x["item_no"], x["long_descr"], x["quantity_available"], x["new_value"],
+                     f"Item: {x['item_no']} {status_col_name} updated from {x['old_value']} to {x['new_value']}"])
+    for key, error in errors.items():
+        rows.append([now, key, "", "", values[key],
+                     f"Item: {key} {status_col_name} failed to update to {values[key]}. {error['message']}"])
+    if rows:
+        write_log_rows(rows, columns, log_location)
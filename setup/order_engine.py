@@ -1,11 +1,210 @@
 import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
 from datetime import timezone
 
-import requests
+from setup.bc_client import bc
+
+
+# Order attributes filled straight from the order header fields of the same name
+ORDER_HEADER_FIELDS = (
+    "customer_id", "date_created", "date_modified", "date_shipped", "status_id", "status", "subtotal_ex_tax",
+    "subtotal_inc_tax", "subtotal_tax", "base_shipping_cost", "shipping_cost_ex_tax", "shipping_cost_inc_tax",
+    "shipping_cost_tax", "shipping_cost_tax_class_id", "base_handling_cost", "handling_cost_ex_tax",
+    "handling_cost_inc_tax", "handling_cost_tax", "handling_cost_tax_class_id", "base_wrapping_cost",
+    "wrapping_cost_ex_tax", "wrapping_cost_inc_tax", "wrapping_cost_tax", "total_ex_tax", "total_inc_tax",
+    "total_tax", "items_total", "items_shipped", "payment_method", "payment_provider_id", "payment_status",
+    "refunded_amount", "order_is_digital", "store_credit_amount", "gift_certificate_amount", "ip_address",
+    "ip_address_v6", "geoip_country", "geoip_country_iso2", "currency_id", "currency_code",
+    "currency_exchange_rate", "default_currency_id", "default_currency_code", "staff_notes", "customer_message",
+    "discount_amount", "coupon_discount", "shipping_address_count", "is_deleted", "ebay_order_id", "cart_id",
+    "is_email_opt_in", "credit_card_type", "order_source", "channel_id", "external_source",
+)
+
+# Order sub-resources, fetched on first read or together by Order.prefetch()
+ORDER_SUB_RESOURCES = ("products", "coupons", "shipping_addresses")
+# Shared across orders so the consumer does not start threads per order
+ORDER_FETCH_WORKERS = 6
+
+
+class FetchMetrics:
+    """Latency of one stage of an order fetch"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.last = 0
+
+    def record(self, seconds):
+        with self.lock:
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+            self.last = seconds
+
+    def stats(self):
+        with self.lock:
+            return {"fetches": self.count, "last_ms": round(self.last * 1000, 1),
+                    "average_ms": round(self.total / self.count * 1000, 1) if self.count else 0,
+                    "max_ms": round(self.max * 1000, 1)}
+
+
+header_metrics = FetchMetrics()
+sub_resource_metrics = FetchMetrics()
+order_fetch_executor = ThreadPoolExecutor(max_workers=ORDER_FETCH_WORKERS, thread_name_prefix="order_fetch")
+
+
+def order_fetch_stats():
+    """Order fetch latency in milliseconds, for the header and for the sub-resource requests"""
+    return {"header": header_metrics.stats(), "sub_resources": sub_resource_metrics.stats()}
+
+
+# Order Store Settings
+# In the project directory, so the API and the order consumer share it wherever they are started from
+ORDER_STORE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "order_store.sqlite3")
+# Stored orders younger than this many seconds are used without checking Big Commerce
+ORDER_STORE_MAX_AGE = 300
+# Sub-resource responses worth keeping. Anything else, such as a 429 or 5xx, is fetched again.
+ORDER_STORE_STATUSES = (200, 204)
+# Invalidations are kept this many seconds to block saves from fetches that started before them
+ORDER_STORE_INVALIDATION_TTL = 3600
+
+
+class OrderStore:
+    """Local SQLite copy of orders as fetched: the header, products, coupons and shipping addresses.
+    An order's copy is dropped when a webhook arrives for it, and replaced when its date_modified changes.
+    Invalidations are recorded, so a fetch that started before one cannot save its copy back."""
+
+    def __init__(self, location=ORDER_STORE):
+        self.location = location
+        self.tables_created = False
+
+    def connect(self):
+        if not self.tables_created:
+            with closing(sqlite3.connect(self.location)) as connection, connection:
+                connection.execute("""
+                CREATE TABLE IF NOT EXISTS ORDERS (
+                ORDER_ID INTEGER PRIMARY KEY, DATE_MODIFIED TEXT, STORED_AT REAL NOT NULL, DATA TEXT NOT NULL)
+                """)
+                connection.execute("""
+                CREATE TABLE IF NOT EXISTS INVALIDATIONS (ORDER_ID INTEGER PRIMARY KEY, INVALIDATED_AT REAL NOT NULL)
+                """)
+            self.tables_created = True
+        return closing(sqlite3.connect(self.location))
+
+    def get(self, order_id):
+        """Returns the stored order with its stored_at time, or None"""
+        with self.connect() as connection:
+            row = connection.execute("SELECT STORED_AT, DATA FROM ORDERS WHERE ORDER_ID = ?",
+                                     (int(order_id),)).fetchone()
+        if row is not None:
+            return {**json.loads(row[1]), "stored_at": row[0]}
+
+    def save(self, order_id, raw, fetched_at):
+        """Saves an order fetched at fetched_at (time.time()), unless it was invalidated since then.
+        Returns True if it was saved."""
+        with self.connect() as connection, connection:
+            cursor = connection.execute(
+                "INSERT OR REPLACE INTO ORDERS (ORDER_ID, DATE_MODIFIED, STORED_AT, DATA) "
+                "SELECT ?, ?, ?, ? WHERE NOT EXISTS "
+                "(SELECT 1 FROM INVALIDATIONS WHERE ORDER_ID = ? AND INVALIDATED_AT >= ?)",
+                (int(order_id), raw["header"].get("date_modified"), fetched_at, json.dumps(raw),
+                 int(order_id), fetched_at))
+            return cursor.rowcount > 0
+
+    def invalidate(self, order_id):
+        now = time.time()
+        with self.connect() as connection, connection:
+            connection.execute("DELETE FROM ORDERS WHERE ORDER_ID = ?", (int(order_id),))
+            connection.execute("INSERT OR REPLACE INTO INVALIDATIONS (ORDER_ID, INVALIDATED_AT) VALUES (?, ?)",
+                               (int(order_id), now))
+            connection.execute("DELETE FROM INVALIDATIONS WHERE INVALIDATED_AT < ?",
+                               (now - ORDER_STORE_INVALIDATION_TTL,))
+
+
+order_store = OrderStore()
+
+
+# Billing attributes filled from billing_address fields
+ORDER_BILLING_FIELDS = {
+    "billing_first_name": "first_name",
+    "billing_last_name": "last_name",
+    "billing_company": "company",
+    "billing_city": "city",
+    "billing_state": "state",
+    "billing_zip": "zip",
+    "billing_country": "country",
+    "billing_country_iso2": "country_iso2",
+    "billing_email": "email",
+    "form_fields": "form_fields",
+}
+
+# Shipping attributes filled from the first shipping address
+ORDER_SHIPPING_FIELDS = {
+    "shipping_first_name": "first_name",
+    "shipping_last_name": "last_name",
+    "shipping_city": "city",
+    "shipping_state": "state",
+    "shipping_zip": "zip",
+    "shipping_email": "email",
+    "shipping_method": "shipping_method",
+}
+
+# Shipping attributes before the shipping address is fetched, or if the order has none
+ORDER_SHIPPING_DEFAULTS = {
+    "shipping_address": {},
+    **{name: "" for name in ORDER_SHIPPING_FIELDS},
+    "shipping_street_address": "",
+    "shipping_phone": "",
+}
+
+# Slot and setter for each sub-resource
+SUB_RESOURCE_SLOTS = {
+    "products": "_order_products",
+    "coupons": "_order_coupons",
+    "shipping_addresses": "_shipping",
+}
+SUB_RESOURCE_SETTERS = {
+    "products": "set_products",
+    "coupons": "set_coupons",
+    "shipping_addresses": "set_shipping_address",
+}
 
 
 class Order:
-    def __init__(self, order_id):
+    __slots__ = (
+        "order_id", "customer_id", "date_created", "date_modified", "date_shipped", "status_id", "status",
+        "subtotal_ex_tax", "subtotal_inc_tax", "subtotal_tax", "base_shipping_cost", "shipping_cost_ex_tax",
+        "shipping_cost_inc_tax", "shipping_cost_tax", "shipping_cost_tax_class_id", "base_handling_cost",
+        "handling_cost_ex_tax", "handling_cost_inc_tax", "handling_cost_tax", "handling_cost_tax_class_id",
+        "base_wrapping_cost", "wrapping_cost_ex_tax", "wrapping_cost_inc_tax", "wrapping_cost_tax",
+        "wrapping_cost_tax_class_i", "total_ex_tax", "total_inc_tax", "total_tax", "items_total",
+        "items_shipped", "payment_method", "payment_provider_id", "payment_status", "refunded_amount",
+        "order_is_digital", "store_credit_amount", "gift_certificate_amount", "ip_address", "ip_address_v6",
+        "geoip_country", "geoip_country_iso2", "currency_id", "currency_code", "currency_exchange_rate",
+        "default_currency_id", "default_currency_code", "staff_notes", "customer_message",
+        "discount_amount", "coupon_discount", "shipping_address_count", "is_deleted", "ebay_order_id",
+        "cart_id", "billing_first_name", "billing_last_name", "billing_company", "billing_street_address",
+        "billing_city", "billing_state", "billing_zip", "billing_country", "billing_country_iso2",
+        "billing_phone", "billing_email", "form_fields", "is_email_opt_in", "credit_card_type",
+        "order_source", "channel_id", "external_source",
+        # Sub-resources, None until fetched. Read through the properties below.
+        "_order_products", "_order_coupons", "_shipping",
+        # Order JSON as fetched, saved to the order store once every sub-resource is loaded
+        "_raw",
+        # When get_order_details started. Saves are skipped if the order was invalidated since.
+        "_fetched_at",
+        # Milliseconds the header request took, or None if the order came from the order store
+        "header_fetch_ms",
+    )
+
+    def __init__(self, order_id, prefetch=False, max_age=ORDER_STORE_MAX_AGE):
         self.order_id = order_id
         self.customer_id = ""
         self.date_created = ""
@@ -79,178 +278,138 @@ class Order:
         self.order_source = ""
         self.channel_id = 1
         self.external_source = ""
-        self.order_products = []
-        self.order_coupons = {}
-        self.shipping_address = {}
-        self.shipping_first_name = ""
-        self.shipping_last_name = ""
-        self.shipping_street_address = ""
-        # self.shipping_street_1 = ""
-        # self.shipping_street_2 = ""
-        self.shipping_city = ""
-        self.shipping_state = ""
-        self.shipping_zip = ""
-        self.shipping_email = ""
-        self.shipping_phone = ""
-        self.shipping_method = ""
-        self.get_order_details()
-
-    def get_order_details(self):
-        from setup import creds
-        url = f" https://api.bigcommerce.com/stores/{creds.big_store_hash}/v2/orders/{self.order_id}"
-        headers = {
-            'X-Auth-Token': creds.big_access_token,
-            'Content-Type': 'application/json',
-            'Accept': 'application/json'
-        }
-        response = (requests.get(url, headers=headers))
+        self._order_products = None
+        self._order_coupons = None
+        self._shipping = None
+        self._raw = {}
+        self._fetched_at = None
+        self.header_fetch_ms = self.get_order_details(max_age)
+        if prefetch:
+            self.prefetch()
+
+    def get_order_details(self, max_age=ORDER_STORE_MAX_AGE):
+        """Fetches the order header. Products, coupons and shipping addresses are fetched when first
+        read, or together by prefetch().
+        A copy from the order store younger than max_age seconds is used without any request. An older
+        copy is still used if the order's date_modified has not changed. Pass max_age=None to skip the store.
+        Returns the milliseconds the header request took, or None if no request was made."""
+        self._fetched_at = time.time()
+        stored = order_store.get(self.order_id) if max_age is not None else None
+        if stored is not None and time.time() - stored["stored_at"] <= max_age:
+            self.load_stored(stored)
+            return None
+        started = time.perf_counter()
+        response = bc.get(f"/v2/orders/{self.order_id}")
         if response.status_code == 200:
             data = response.json()
-            pretty = response.content
-            pretty = json.loads(pretty)
-            pretty = json.dumps(pretty, indent=4)
-            print("----")
-            print("Order")
-            print(pretty)
-            print("----")
-            self.customer_id = data['customer_id']
-            self.date_created = data['date_created']
-            self.date_modified = data['date_modified']
-            self.date_shipped = data['date_shipped']
-            self.status_id = data['status_id']
-            self.status = data['status']
-            self.subtotal_ex_tax = data['subtotal_ex_tax']
-            self.subtotal_inc_tax = data['subtotal_inc_tax']
-            self.subtotal_tax = data['subtotal_tax']
-            self.base_shipping_cost = data['base_shipping_cost']
-            self.shipping_cost_ex_tax = data['shipping_cost_ex_tax']
-            self.shipping_cost_inc_tax = data['shipping_cost_inc_tax']
-            self.shipping_cost_tax = data['shipping_cost_tax']
-            self.shipping_cost_tax_class_id = data['shipping_cost_tax_class_id']
-            self.base_handling_cost = data['base_handling_cost']
-            self.handling_cost_ex_tax = data['handling_cost_ex_tax']
-            self.handling_cost_inc_tax = data['handling_cost_inc_tax']
-            self.handling_cost_tax = data['handling_cost_tax']
-            self.handling_cost_tax_class_id = data['handling_cost_tax_class_id']
-            self.base_wrapping_cost = data['base_wrapping_cost']
-            self.wrapping_cost_ex_tax = data['wrapping_cost_ex_tax']
-            self.wrapping_cost_inc_tax = data['wrapping_cost_inc_tax']
-            self.wrapping_cost_tax = data['wrapping_cost_tax']
-            self.wrapping_cost_tax_class_i = data['wrapping_cost_tax_class_id']
-            self.total_ex_tax = data['total_ex_tax']
-            self.total_inc_tax = data['total_inc_tax']
-            self.total_tax = data['total_tax']
-            self.items_total = data['items_total']
-            self.items_shipped = data['items_shipped']
-            self.payment_method = data['customer_id']
-            self.payment_provider_id = data['payment_provider_id']
-            self.payment_status = data['payment_status']
-            self.refunded_amount = data['refunded_amount']
-            self.order_is_digital = data['order_is_digital']
-            self.store_credit_amount = data['store_credit_amount']
-            self.gift_certificate_amount = data['gift_certificate_amount']
-            self.ip_address = data['ip_address']
-            self.ip_address_v6 = data['ip_address_v6']
-            self.geoip_country = data['geoip_country']
-            self.geoip_country_iso2 = data['geoip_country_iso2']
-            self.currency_id = data['currency_id']
-            self.currency_code = data['currency_code']
-            self.currency_exchange_rate = data['currency_exchange_rate']
-            self.default_currency_id = data['default_currency_id']
-            self.default_currency_code = data['default_currency_code']
-            self.staff_notes = data['staff_notes']
-            self.customer_message = data['customer_message']
-            self.discount_amount = data['discount_amount']
-            self.coupon_discount = data['coupon_discount']
-            self.shipping_address_count = data['shipping_address_count']
-            self.is_deleted = data['is_deleted']
-            self.ebay_order_id = data['ebay_order_id']
-            self.cart_id = data['cart_id']
-            self.billing_first_name = data['billing_address']['first_name']
-            self.billing_last_name = data['billing_address']['last_name']
-            self.billing_company = data['billing_address']['company']
-            if data['billing_address']['street_2'] == '':
-                self.billing_street_address = data['billing_address']['street_1']
+            if stored is not None and stored["header"]["date_modified"] == data["date_modified"]:
+                self.load_stored(stored)
+                self.save_if_complete()
             else:
-                self.billing_street_address = (data['billing_address']['street_1'] + "\n" +
-                                               data['billing_address']['street_2'])
-            # self.billing_street_1 = data['billing_address']['street_1']
-            # self.billing_street_2 = data['billing_address']['street_2']
-            self.billing_city = data['billing_address']['city']
-            self.billing_state = data['billing_address']['state']
-            self.billing_zip = data['billing_address']['zip']
-            self.billing_country = data['billing_address']['country']
-            self.billing_country_iso2 = data['billing_address']['country_iso2']
-            self.billing_phone = format_phone(data['billing_address']['phone'], mode='clickable')
-            self.billing_email = data['billing_address']['email']
-            self.form_fields = data['billing_address']['form_fields']
-            self.is_email_opt_in = data['is_email_opt_in']
-            self.credit_card_type = data['credit_card_type']
-            self.order_source = data['order_source']
-            self.channel_id = data['channel_id']
-            self.external_source = data['external_source']
-
-            # Get Products
-            url = f" https://api.bigcommerce.com/stores/{creds.big_store_hash}/v2/orders/{self.order_id}/products"
-            headers = {
-                'X-Auth-Token': creds.big_access_token,
-                'Content-Type': 'application/json',
-                'Accept': 'application/json'
+                self.set_header(data)
+        elapsed = time.perf_counter() - started
+        header_metrics.record(elapsed)
+        return round(elapsed * 1000, 1)
+
+    def load_stored(self, stored):
+        """Loads a stored order. Sub-resources stored with a failed response are left unloaded so
+        they are fetched again."""
+        self.set_header(stored["header"])
+        for name in ORDER_SUB_RESOURCES:
+            if stored.get(name) and stored[name][0] in ORDER_STORE_STATUSES:
+                getattr(self, SUB_RESOURCE_SETTERS[name])(*stored[name])
+
+    def save_if_complete(self):
+        """Saves the order to the store once the header and every sub-resource loaded successfully"""
+        if "header" in self._raw and all(x in self._raw and self._raw[x][0] in ORDER_STORE_STATUSES
+                                         for x in ORDER_SUB_RESOURCES):
+            order_store.save(self.order_id, self._raw, self._fetched_at)
+
+    def prefetch(self, *resources):
+        """Fetches sub-resources that have not been loaded yet, concurrently. Fetches all of them
+        unless names from ORDER_SUB_RESOURCES are given. Returns the milliseconds the requests took,
+        or None if everything was already loaded."""
+        missing = [x for x in resources or ORDER_SUB_RESOURCES if getattr(self, SUB_RESOURCE_SLOTS[x]) is None]
+        if not missing:
+            return None
+        started = time.perf_counter()
+        if len(missing) == 1:
+            responses = [bc.get(f"/v2/orders/{self.order_id}/{missing[0]}")]
+        else:
+            responses = order_fetch_executor.map(lambda x: bc.get(f"/v2/orders/{self.order_id}/{x}"), missing)
+        for name, response in zip(missing, responses):
+            data = response.json() if response.status_code == 200 else None
+            getattr(self, SUB_RESOURCE_SETTERS[name])(response.status_code, data)
+        elapsed = time.perf_counter() - started
+        sub_resource_metrics.record(elapsed)
+        self.save_if_complete()
+        return round(elapsed * 1000, 1)
+
+    @property
+    def order_products(self):
+        if self._order_products is None:
+            self.prefetch("products")
+        return self._order_products
+
+    @property
+    def order_coupons(self):
+        if self._order_coupons is None:
+            self.prefetch("coupons")
+        return self._order_coupons
+
+    @property
+    def shipping_details(self):
+        if self._shipping is None:
+            self.prefetch("shipping_addresses")
+        return self._shipping
+
+    def set_header(self, data):
+        self._raw["header"] = data
+        for name in ORDER_HEADER_FIELDS:
+            setattr(self, name, data[name])
+        self.wrapping_cost_tax_class_i = data['wrapping_cost_tax_class_id']
+        billing_address = data['billing_address']
+        for name, field in ORDER_BILLING_FIELDS.items():
+            setattr(self, name, billing_address[field])
+        if billing_address['street_2'] == '':
+            self.billing_street_address = billing_address['street_1']
+        else:
+            self.billing_street_address = (billing_address['street_1'] + "\n" +
+                                           billing_address['street_2'])
+        self.billing_phone = format_phone(billing_address['phone'], mode='clickable')
+
+    def set_products(self, status_code, data):
+        self._raw["products"] = [status_code, data]
+        self._order_products = []
+        if status_code == 200:
+            for x in data:
+                self._order_products.append(x)
+
+    def set_coupons(self, status_code, data):
+        self._raw["coupons"] = [status_code, data]
+        self._order_coupons = {}
+        if status_code == 200:
+            self._order_coupons = data[0]
+        elif status_code == 204:
+            self._order_coupons = {
+                "code": None
             }
-            response = (requests.get(url, headers=headers))
-            if response.status_code == 200:
-                data = response.json()
-                pretty = response.content
-                pretty = json.loads(pretty)
-                pretty = json.dumps(pretty, indent=4)
-                print("----")
-                print("Products")
-                print(pretty)
-                print("----")
-                for x in data:
-                    self.order_products.append(x)
-
-            # Get Coupons
-            url = f"https://api.bigcommerce.com/stores/wmonsw2bbs/v2/orders/{self.order_id}/coupons"
-            response = (requests.get(url, headers=headers))
-            if response.status_code == 200:
-                data = response.json()
-                self.order_coupons = data[0]
-            elif response.status_code == 204:
-                self.order_coupons = {
-                    "code": None
-                }
-
-            # Get Shipping Addresses
-            url = f"https://api.bigcommerce.com/stores/{creds.big_store_hash}/v2/orders/{self.order_id}/shipping_addresses"
-            response = (requests.get(url, headers=headers))
-            if response.status_code == 200:
-                data = response.json()
-                self.shipping_first_name = data[0]['first_name']
-                self.shipping_last_name = data[0]['last_name']
-                if data[0]['street_2'] == '':
-                    self.shipping_street_address = data[0]['street_1']
-                else:
-                    self.shipping_street_address = (data[0]['street_1'] + "\n" +
-                                                    data[0]['street_2'])
-                # self.shipping_street_1 = data[0]['street_1']
-                # self.shipping_street_2 = data[0]['street_2']
-                self.shipping_city = data[0]['city']
-                self.shipping_state = data[0]['state']
-                self.shipping_zip = data[0]['zip']
-                self.shipping_email = data[0]['email']
-                self.shipping_phone = format_phone(data[0]['phone'], mode='clickable')
-                self.shipping_method = data[0]['shipping_method']
+
+    def set_shipping_address(self, status_code, data):
+        self._raw["shipping_addresses"] = [status_code, data]
+        self._shipping = dict(ORDER_SHIPPING_DEFAULTS)
+        if status_code == 200:
+            self._shipping["shipping_address"] = data[0]
+            for name, field in ORDER_SHIPPING_FIELDS.items():
+                self._shipping[name] = data[0][field]
+            if data[0]['street_2'] == '':
+                self._shipping["shipping_street_address"] = data[0]['street_1']
+            else:
+                self._shipping["shipping_street_address"] = (data[0]['street_1'] + "\n" +
+                                                             data[0]['street_2'])
+            self._shipping["shipping_phone"] = format_phone(data[0]['phone'], mode='clickable')
 
     def refund_order(self):
-        from setup import creds
-        url = (f'https://api.bigcommerce.com/stores/{creds.big_store_hash}/'
-               f'v3/orders/{self.order_id}/payment_actions/refund_quotes')
-        headers = {
-            'X-Auth-Token': creds.big_access_token,
-            'Content-Type': 'application/json',
-            'Accept': 'application/json'
-        }
         refund_products = []
         shipping_id = ""
         for x in self.order_products:
@@ -270,7 +429,7 @@ class Order:
         payload = {
             'items': refund_products
         }
-        response = requests.post(url, headers=headers, json=payload)
+        response = bc.post(f"/v3/orders/{self.order_id}/payment_actions/refund_quotes", json=payload)
         # data = response.json()
         data = response.json()
         pretty = response.content
@@ -280,6 +439,14 @@ class Order:
         # To be continued
 
 
+def shipping_property(name):
+    return property(lambda self: self.shipping_details[name])
+
+
+for shipping_attribute in ORDER_SHIPPING_DEFAULTS:
+    setattr(Order, shipping_attribute, shipping_property(shipping_attribute))
+
+
 def utc_to_local(utc_dt):
     return utc_dt.replace(tzinfo=timezone.utc).astimezone(tz=None)
 
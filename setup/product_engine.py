@@ -1,15 +1,87 @@
-import pandas
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor
 
+from setup import description_engine
 from setup.big_products import *
+from setup.catalog_engine import catalog
+from setup.mapping_engine import bc_ids
+from setup.search_engine import search_index
 from setup.date_presets import *
 from setup.query_engine import QueryEngine
-from setup.log_engine import create_product_log
+from setup.sales_engine import get_qty_sold
+from setup.mutation_engine import MUTATION_CHUNK_SIZE, log_changes, update_items
 
 db = QueryEngine()
 
+# SQL Server allows 2100 parameters per statement
+BULK_LOAD_CHUNK_SIZE = 1000
+
+# Product Cache Settings
+PRODUCT_CACHE_SIZE = 2000
+# Seconds a cached product is served before it is loaded again
+PRODUCT_CACHE_TTL = 60
+# Seconds between LST_MAINT_DT polls for changed items. None turns polling off.
+PRODUCT_CACHE_POLL_INTERVAL = None
+
+# Concurrent Big Commerce requests when variants have to be fetched one at a time
+VARIANT_FETCH_WORKERS = 8
+
+# Column aliases match Product attribute names so rows are mapped by name
+PRODUCT_DETAILS_COLUMNS = """
+    ITEM.ITEM_NO AS item_no, ITEM.USR_PROF_ALPHA_16 AS binding_key, ITEM.USR_PROF_ALPHA_17 AS variant_name,
+    ITEM.IS_ADM_TKT AS is_parent, ITEM.DESCR AS descr, ITEM.LONG_DESCR AS long_descr, ITEM.PROF_COD_1 AS brand,
+    ITEM.PRC_1 AS price_1, PRC.PRC_2 AS price_2, ITEM.REG_PRC AS reg_price,
+    ISNULL(INV.QTY_AVAIL, 0) AS quantity_available, ISNULL(ITEM.PROF_NO_1, 0) AS buffer,
+    ITEM.IS_ECOMM_ITEM AS web_enabled, ITEM.USR_CPC_IS_ENABLED AS web_visible,
+    ITEM.USR_ALWAYS_ONLINE AS always_online, ITEM.IS_FOOD_STMP_ITEM AS gift_wrap,
+    ITEM.USR_IN_STORE_ONLY AS in_store_only, ITEM.ADDL_DESCR_1 AS web_title, ITEM.ADDL_DESCR_2 AS meta_title,
+    ITEM.USR_PROF_ALPHA_21 AS meta_description, ITEM.ITEM_TYP AS item_type, ITEM.CATEG_COD AS parent_category,
+    ITEM.SUBCAT_COD AS sub_category, ITEM.STAT AS status, ITEM.VEND_ITEM_NO AS vendor,
+    ITEM.PROF_ALPHA_1 AS custom_field_bontanical_name, ITEM.PROF_ALPHA_2 AS custom_field_climate_zone,
+    ITEM.PROF_ALPHA_3 AS custom_field_plant_type, ITEM.PROF_ALPHA_4 AS custom_field_type,
+    ITEM.PROF_ALPHA_5 AS custom_field_height, ITEM.USR_PROF_ALPHA_6 AS custom_field_width,
+    ITEM.USR_PROF_ALPHA_7 AS custom_field_sun_exposure, ITEM.USR_PROF_ALPHA_8 AS custom_field_bloom_time,
+    ITEM.USR_PROF_ALPHA_9 AS custom_field_flower_color, ITEM.USR_PROF_ALPHA_10 AS custom_field_attracts_pollinators,
+    ITEM.USR_PROF_ALPHA_11 AS custom_field_growth_rate, ITEM.USR_PROF_ALPHA_12 AS custom_field_deer_resistant,
+    ITEM.USR_PROF_ALPHA_13 AS custom_field_soil_type, ITEM.USR_PROF_ALPHA_14 AS custom_field_color,
+    ITEM.USR_PROF_ALPHA_15 AS custom_field_size, ITEM.USR_PROF_ALPHA_26 AS search_key,
+    ITEM.USR_PROF_ALPHA_27 AS sort_order, ITEM.USR_PROF_ALPHA_19 AS preorder_message,
+    ITEM.USR_PROF_ALPHA_20 AS availability_description, EC_CATEG.DESCR AS e_comm_category,
+    EC_ITEM_DESCR.HTML_DESCR AS web_description, ITEM.ECOMM_NEW AS featured
+"""
+
+PRODUCT_DETAILS_TABLES = """IM_ITEM ITEM
+    INNER JOIN IM_PRC PRC ON ITEM.ITEM_NO=PRC.ITEM_NO
+    LEFT OUTER JOIN IM_INV INV ON ITEM.ITEM_NO=INV.ITEM_NO
+    LEFT OUTER JOIN EC_ITEM_DESCR ON ITEM.ITEM_NO=EC_ITEM_DESCR.ITEM_NO
+    LEFT OUTER JOIN EC_CATEG_ITEM ON ITEM.ITEM_NO=EC_CATEG_ITEM.ITEM_NO
+    LEFT OUTER JOIN EC_CATEG ON EC_CATEG.CATEG_ID=EC_CATEG_ITEM.CATEG_ID
+"""
+
+
+def row_columns(row):
+    """Column names of a pyodbc result row"""
+    return tuple(x[0] for x in row.cursor_description)
+
 
 class Product:
-    def __init__(self, item_number):
+    __slots__ = (
+        "item_no", "binding_key", "variant_name", "product_id", "variant_id", "is_parent", "descr",
+        "long_descr", "brand", "price_1", "price_2", "reg_price", "quantity_available", "buffer",
+        "buffered_quantity_available", "web_enabled", "web_visible", "always_online", "gift_wrap",
+        "in_store_only", "web_title", "meta_title", "meta_description", "item_type", "parent_category",
+        "sub_category", "status", "vendor", "custom_field_bontanical_name", "custom_field_climate_zone",
+        "custom_field_plant_type", "custom_field_type", "custom_field_height", "custom_field_width",
+        "custom_field_sun_exposure", "custom_field_bloom_time", "custom_field_flower_color",
+        "custom_field_attracts_pollinators", "custom_field_growth_rate", "custom_field_deer_resistant",
+        "custom_field_soil_type", "custom_field_color", "custom_field_size", "search_key", "sort_order",
+        "preorder_message", "availability_description", "e_comm_category", "web_description", "featured",
+    )
+
+    def __init__(self, item_number, load=True):
         self.item_no = item_number
         self.binding_key = ""
         self.variant_name = ""
@@ -60,120 +132,104 @@ class Product:
         self.e_comm_category = ""
         self.web_description = ""
         self.featured = ""
-        self.get_product_details()
+        if load:
+            self.get_product_details()
 
     def get_product_details(self):
         query = f"""
-        select ITEM.ITEM_NO, ITEM.USR_PROF_ALPHA_16, ITEM.USR_PROF_ALPHA_17, ITEM.IS_ADM_TKT, ITEM.DESCR, 
-        ITEM.LONG_DESCR, ITEM.PROF_COD_1, ITEM.PRC_1, PRC.PRC_2, ITEM.REG_PRC, ISNULL(INV.QTY_AVAIL, 0), 
-        ISNULL(ITEM.PROF_NO_1, 0), ITEM.IS_ECOMM_ITEM, ITEM.USR_CPC_IS_ENABLED, ITEM.USR_ALWAYS_ONLINE,
-        ITEM.IS_FOOD_STMP_ITEM, ITEM.USR_IN_STORE_ONLY, ITEM.ADDL_DESCR_1, ITEM.ADDL_DESCR_2, ITEM.USR_PROF_ALPHA_21, 
-        ITEM.ITEM_TYP,ITEM.CATEG_COD, ITEM.SUBCAT_COD, ITEM.STAT, ITEM.VEND_ITEM_NO,ITEM.PROF_ALPHA_1,ITEM.PROF_ALPHA_2,  
-        ITEM.PROF_ALPHA_3,  ITEM.PROF_ALPHA_4,  ITEM.PROF_ALPHA_5, ITEM.USR_PROF_ALPHA_6, ITEM.USR_PROF_ALPHA_7, 
-        ITEM.USR_PROF_ALPHA_8,  ITEM.USR_PROF_ALPHA_9,  ITEM.USR_PROF_ALPHA_10,  ITEM.USR_PROF_ALPHA_11,
-        ITEM.USR_PROF_ALPHA_12, ITEM.USR_PROF_ALPHA_13, ITEM.USR_PROF_ALPHA_14, ITEM.USR_PROF_ALPHA_15, 
-        USR_PROF_ALPHA_26, USR_PROF_ALPHA_27, USR_PROF_ALPHA_18, USR_PROF_ALPHA_19, USR_PROF_ALPHA_20, 
-        EC_CATEG.DESCR, EC_ITEM_DESCR.HTML_DESCR, ITEM.ECOMM_NEW
-        FROM IM_ITEM ITEM
-        INNER JOIN IM_PRC PRC ON ITEM.ITEM_NO=PRC.ITEM_NO
-        LEFT OUTER JOIN IM_INV INV ON ITEM.ITEM_NO=INV.ITEM_NO
-        LEFT OUTER JOIN EC_ITEM_DESCR ON ITEM.ITEM_NO=EC_ITEM_DESCR.ITEM_NO
-        LEFT OUTER JOIN EC_CATEG_ITEM ON ITEM.ITEM_NO=EC_CATEG_ITEM.ITEM_NO
-        LEFT OUTER JOIN EC_CATEG ON EC_CATEG.CATEG_ID=EC_CATEG_ITEM.CATEG_ID
-        WHERE ITEM.ITEM_NO = '{self.item_no}'
+        SELECT {PRODUCT_DETAILS_COLUMNS}
+        FROM {PRODUCT_DETAILS_TABLES}
+        WHERE ITEM.ITEM_NO = ?
         """
-        response = db.query_db(query)
+        response = db.query_db(query, (self.item_no,))
         if response is not None:
+            columns = row_columns(response[0])
             for x in response:
-                self.item_no = x[0]
-                self.binding_key = x[1]
-                self.variant_name = x[2]
-                self.is_parent = x[3]
-                self.descr = x[4]
-                self.long_descr = x[5]
-                self.brand = x[6]
-                self.price_1 = x[7]
-                self.price_2 = x[8]
-                self.reg_price = x[9]
-                self.quantity_available = int(x[10])
-                self.buffer = int(x[11])
-                if self.quantity_available - self.buffer < 0:
-                    self.buffered_quantity_available = 0
-                else:
-                    self.buffered_quantity_available = self.quantity_available - self.buffer
-                self.web_enabled = x[12]
-                self.web_visible = x[13]
-                self.always_online = x[14]
-                self.gift_wrap = x[15]
-                self.in_store_only = x[16]
-                self.web_title = x[17]
-                self.meta_title = x[18]
-                self.meta_description = x[19]
-                self.item_type = x[20]
-                self.parent_category = x[21]
-                self.sub_category = x[22]
-                self.status = x[23]
-                self.vendor = x[24]
-                self.custom_field_bontanical_name = x[25]
-                self.custom_field_climate_zone = x[26]
-                self.custom_field_plant_type = x[27]
-                self.custom_field_type = x[28]
-                self.custom_field_height = x[29]
-                self.custom_field_width = x[30]
-                self.custom_field_sun_exposure = x[31]
-                self.custom_field_bloom_time = x[32]
-                self.custom_field_flower_color = x[33]
-                self.custom_field_attracts_pollinators = x[34]
-                self.custom_field_growth_rate = x[35]
-                self.custom_field_deer_resistant = x[36]
-                self.custom_field_soil_type = x[37]
-                self.custom_field_color = x[38]
-                self.custom_field_size = x[39]
-                self.search_key = x[40]
-                if x[41] is not None:
-                    self.sort_order = int(x[41])
-                self.preorder_message = x[43]
-                self.availability_description = x[44]
-                self.e_comm_category = x[45]
-                self.web_description = x[46]
-                self.featured = x[47]
-                self.product_id = self.get_product_id()
-                self.variant_id = self.get_variant_id()
+                self.set_details(x, columns)
+            self.product_id = self.get_product_id()
+            self.variant_id = self.get_variant_id()
 
         else:
             return "No Item Matching that SKU"
 
+    def set_details(self, x, columns=None):
+        """Sets properties from a result row, matching column names to attribute names"""
+        if columns is None:
+            columns = row_columns(x)
+        for name, value in zip(columns, x):
+            setattr(self, name, value)
+        self.set_buffered_quantity()
+        if self.sort_order is not None:
+            self.sort_order = int(self.sort_order)
+        else:
+            self.sort_order = 0
+
+    def to_dict(self):
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    @classmethod
+    def bulk_load(cls, item_nos):
+        """Loads many products with one query per BULK_LOAD_CHUNK_SIZE SKUs, including their Big Commerce
+        product and variant IDs. Returns {item_no: Product}. SKUs with no match are left out."""
+        item_nos = list(dict.fromkeys(item_nos))
+        products = {}
+        for i in range(0, len(item_nos), BULK_LOAD_CHUNK_SIZE):
+            chunk = item_nos[i:i + BULK_LOAD_CHUNK_SIZE]
+            query = f"""
+            SELECT {PRODUCT_DETAILS_COLUMNS}, BC_PRODUCT.PRODUCT_ID AS product_id, BC_VARIANT.VARIANT_ID AS variant_id
+            FROM {PRODUCT_DETAILS_TABLES}
+            OUTER APPLY (
+                SELECT TOP 1 PRODUCT_ID FROM CPI_BC_PRODUCTS
+                WHERE ITEM_NO = ISNULL(ITEM.USR_PROF_ALPHA_16, ITEM.ITEM_NO) AND WEB_ID = '1'
+                ORDER BY CREATE_DATE DESC) BC_PRODUCT
+            OUTER APPLY (
+                SELECT TOP 1 VARIANT_ID FROM CPI_BC_PROD
+                WHERE SKU = ITEM.ITEM_NO AND WEB_ID = '1' AND ITEM.USR_PROF_ALPHA_16 IS NOT NULL
+                ORDER BY PRODUCT_ID) BC_VARIANT
+            WHERE ITEM.ITEM_NO IN ({", ".join("?" * len(chunk))})
+            """
+            columns = None
+            for x in db.query_stream(query, tuple(chunk)):
+                if columns is None:
+                    columns = row_columns(x)
+                if x[0] not in products:
+                    products[x[0]] = cls(x[0], load=False)
+                products[x[0]].set_details(x, columns)
+        return products
+
     def get_child_products(self):
         if self.binding_key is not None:
             if self.is_parent == 'Y':
-                query = f"""
+                query = """
                 SELECT ITEM_NO
                 FROM IM_ITEM
-                WHERE USR_PROF_ALPHA_16 = '{self.binding_key}' AND IS_ADM_TKT = 'N'
+                WHERE USR_PROF_ALPHA_16 = ? AND IS_ADM_TKT = 'N'
                 ORDER BY PRC_1
                 """
-                response = db.query_db(query)
+                response = db.query_db(query, (self.binding_key,))
                 if response is not None:
                     child_products = []
                     for x in response:
                         child_products.append(x[0])
                     return child_products
 
-    def get_child_product_info(self, bc=True):
+    def get_child_product_info(self, bc=True, max_age=MIRROR_MAX_AGE):
         if self.binding_key is not None:
             if self.is_parent == 'Y':
                 child_products = get_all_child_products(self.binding_key)
                 if child_products is not None:
                     child_info = ""
-                    for x in child_products:
-                        item = Product(x)
-                        # if mode is bc, perform API call and get info from Big Commerce
-                        if bc:
-                            info = bc_get_variant(item.product_id, item.variant_id)
-                            child_info += info
-                        # else get information from Counterpoint
-                        else:
-                            for k, v in item.__dict__.items():
+                    # Load all children together, keeping the original order
+                    loaded = get_products(child_products)
+                    children = [loaded[x] if x in loaded else get_product(x) for x in child_products]
+                    # if mode is bc, perform API call and get info from Big Commerce
+                    if bc:
+                        for info in get_child_variants(children, max_age):
+                            child_info += json.dumps(info, indent=4)
+                    # else get information from Counterpoint
+                    else:
+                        for item in children:
+                            for k, v in item.to_dict().items():
                                 child_info += f"{k}: {v}\n"
                             child_info += "\n\n"
 
@@ -185,71 +241,43 @@ class Product:
 
     def get_product_id(self):
         if self.binding_key is not None:
-            query = f"""
-            SELECT TOP 1 PRODUCT_ID FROM CPI_BC_PRODUCTS
-            WHERE ITEM_NO = '{self.binding_key}' AND WEB_ID = '1'
-            ORDER BY CREATE_DATE DESC"""
+            return bc_ids.product_id(self.binding_key)
         else:
-            query = f"""
-            SELECT TOP 1 PRODUCT_ID FROM CPI_BC_PRODUCTS
-            WHERE ITEM_NO = '{self.item_no}' AND WEB_ID = '1'
-            ORDER BY CREATE_DATE DESC"""
-        response = db.query_db(query)
-        if response is not None:
-            return response[0][0]
+            return bc_ids.product_id(self.item_no)
 
     def get_variant_id(self):
-        query = f"""
-        SELECT VARIANT_ID
-        FROM CPI_BC_PROD
-        WHERE SKU = '{self.item_no}' AND WEB_ID = '1'
-        """
         if self.binding_key is not None:
-            response = db.query_db(query)
+            response = bc_ids.variant_ids_for(self.item_no)
             if response is not None:
-                return response[0][0]
+                return response[1]
+
+    def set_buffered_quantity(self):
+        self.quantity_available = int(self.quantity_available)
+        self.buffer = int(self.buffer)
+        if self.quantity_available - self.buffer < 0:
+            self.buffered_quantity_available = 0
+        else:
+            self.buffered_quantity_available = self.quantity_available - self.buffer
+
+    def apply_change(self, attribute, result):
+        """Sets an attribute from a mutation result. Returns True if the write landed."""
+        if result is None or result["code"] != 200:
+            return False
+        setattr(self, attribute, result["new_value"])
+        self.quantity_available = result["quantity_available"]
+        self.set_buffered_quantity()
+        return True
 
     def set_buffer(self, buffer):
         initial_buffer = self.buffer
         if buffer == initial_buffer:
             print(f"Buffer for item: {self.item_no} - {self.long_descr} already at {self.buffer}")
             return
+        result = set_buffers({self.item_no: buffer})[self.item_no]
+        if self.apply_change("buffer", result):
+            print(f"{self.item_no}: {self.long_descr} buffer changed from {initial_buffer} to {self.buffer}")
         else:
-            query = f"""
-            UPDATE IM_ITEM
-            SET PROF_NO_1 = '{buffer}', LST_MAINT_DT = '{str(datetime.now())[:-6] + "000"}'
-            WHERE ITEM_NO = '{self.item_no}'"""
-            # Update SQL Table
-            db.query_db(query, commit=True)
-            # Update Object Properties
-            self.get_product_details()
-            # Check for success
-            if self.buffer == buffer:
-                # Success!
-                print(f"{self.item_no}: {self.long_descr} sort order changed from "
-                      f"{initial_buffer} to {buffer}")
-                # Write Success Log
-                create_product_log(item_no=self.item_no,
-                                   product_name=self.long_descr,
-                                   qty_avail=self.quantity_available,
-                                   status_1_col_name="buffer",
-                                   status_1_data=self.buffer,
-                                   status_2_col_name="Message",
-                                   status_2_data=f"Item: {self.item_no} buffer updated from "
-                                                 f"{initial_buffer} to {self.buffer}",
-                                   log_location=creds.buffer_log)
-                # If unsuccessful:
-            else:
-                print(f"{self.item_no}: {self.long_descr} failed to change sort order to {buffer}")
-                # Write failure log
-                create_product_log(item_no=self.item_no,
-                                   product_name=self.long_descr,
-                                   qty_avail=self.quantity_available,
-                                   status_1_col_name="buffer",
-                                   status_1_data=self.buffer,
-                                   status_2_col_name="Message",
-                                   status_2_data=f"Item: {self.item_no} buffer failed to update to {buffer}.",
-                                   log_location=creds.buffer_log)
+            print(f"{self.item_no}: {self.long_descr} failed to change buffer to {buffer}")
 
     def set_sort_order(self, target_sort_order=0):
         old_sort_order = self.sort_order
@@ -257,105 +285,36 @@ class Product:
         if old_sort_order == target_sort_order:
             print(f"{self.item_no}: {self.long_descr} sort order unchanged. Current Order: {self.sort_order}")
             return
-        # If not, change sort order to the target sort order
+        result = set_sort_orders({self.item_no: target_sort_order})[self.item_no]
+        if self.apply_change("sort_order", result):
+            self.sort_order = int(self.sort_order)
+            print(f"{self.item_no}: {self.long_descr} sort order changed from "
+                  f"{old_sort_order} to {self.sort_order}")
         else:
-            query = f"""
-            UPDATE IM_ITEM
-            SET USR_PROF_ALPHA_27 = '{target_sort_order}', LST_MAINT_DT = '{str(datetime.now())[:-6] + "000"}'
-            WHERE ITEM_NO = '{self.item_no}'
-            """
-            db.query_db(query, commit=True)
-            self.get_product_details()
-            # Check if write was successful
-            if self.sort_order == target_sort_order:
-                # Success!
-                print(f"{self.item_no}: {self.long_descr} sort order changed from "
-                      f"{old_sort_order} to {self.sort_order}")
-                # Write Success Log
-                create_product_log(item_no=self.item_no,
-                                   product_name=self.long_descr,
-                                   qty_avail=self.quantity_available,
-                                   status_1_col_name="sort_order",
-                                   status_1_data=self.sort_order,
-                                   status_2_col_name="Message",
-                                   status_2_data=f"Item: {self.item_no} sort order updated from "
-                                                 f"{old_sort_order} to {self.sort_order}",
-                                   log_location=creds.sort_order_log)
-            # If unsuccessful:
-            else:
-                print(f"{self.item_no}: {self.long_descr} failed to change sort order to {target_sort_order}")
-                # Write failure log
-                create_product_log(item_no=self.item_no,
-                                   product_name=self.long_descr,
-                                   qty_avail=self.quantity_available,
-                                   status_1_col_name="sort_order",
-                                   status_1_data=self.sort_order,
-                                   status_2_col_name="Message",
-                                   status_2_data=f"Item: {self.item_no} sort order failed to update.",
-                                   log_location=creds.sort_order_log)
+            print(f"{self.item_no}: {self.long_descr} failed to change sort order to {target_sort_order}")
 
     def set_featured(self, status):
         if self.binding_key is None:
-            query = f"""
-            UPDATE IM_ITEM
-            SET ECOMM_NEW = '{status}', LST_MAINT_DT = '{str(datetime.now())[:-6] + "000"}'
-            WHERE ITEM_NO = '{self.item_no}'
-            """
+            result = set_featured_items({self.item_no: status})
         else:
-            query = f"""
-            UPDATE IM_ITEM
-            SET ECOMM_NEW = '{status}', LST_MAINT_DT = '{str(datetime.now())[:-6] + "000"}'
-            WHERE USR_PROF_ALPHA_16 = '{self.binding_key}' AND IS_ADM_TKT = 'Y'
-            """
-        db.query_db(query, commit=True)
-        # Update the item details
-        self.get_product_details()
-        if status == 'Y':
-            # Check if write was successful
-            if self.featured == 'Y':
-                print(f"Item: {self.item_no} updated to featured")
-                # Write Success Log
-                create_product_log(item_no=self.item_no,
-                                   product_name=self.long_descr,
-                                   qty_avail=self.quantity_available,
-                                   status_1_col_name="featured",
-                                   status_1_data=self.featured,
-                                   status_2_col_name="Message",
-                                   status_2_data=f"Item: {self.item_no} updated to featured",
-                                   log_location=creds.featured_products)
-            # If Unsuccessful
-            else:
-                print(f"Item: {self.item_no} failed to update to featured")
-                # Write failure Log
-                create_product_log(item_no=self.item_no,
-                                   product_name=self.long_descr,
-                                   qty_avail=self.quantity_available,
-                                   status_1_col_name="featured",
-                                   status_1_data=status,
-                                   status_2_col_name="Message",
-                                   status_2_data=f"Item: {self.item_no} failed to update to featured",
-                                   log_location=creds.featured_products)
+            # Merged products are featured through their parent
+            result = set_featured_bindings({self.binding_key: status})
+        self.apply_change("featured", result.get(self.item_no))
+        label = "featured" if status == 'Y' else "NOT featured"
+        if any(x["code"] == 200 for x in result.values()):
+            print(f"Item: {self.item_no} updated to {label}")
         else:
-            if self.featured == 'N':
-                print(f"Item: {self.item_no} updated to NOT featured")
-                # Write Success Log
-                create_product_log(item_no=self.item_no,
-                                   product_name=self.long_descr,
-                                   qty_avail=self.quantity_available,
-                                   status_1_col_name="featured",
-                                   status_1_data=self.featured,
-                                   status_2_col_name="Message",
-                                   status_2_data=f"Item: {self.item_no} updated to featured",
-                                   log_location=creds.featured_products)
+            print(f"Item: {self.item_no} failed to update to {label}")
 
     def set_sale_price(self, discount):
         sale_price = round(float(self.price_1 * (100 - discount) / 100), 2)
-        query = f"""
+        query = """
         UPDATE IM_PRC
-        SET PRC_2 = '{sale_price}', LST_MAINT_DT = GETDATE()
-        WHERE ITEM_NO = '{self.item_no}'
+        SET PRC_2 = ?, LST_MAINT_DT = GETDATE()
+        WHERE ITEM_NO = ?
         """
-        db.query_db(query, commit=True)
+        db.query_db(query, (sale_price, self.item_no), commit=True)
+        product_cache.invalidate(self.item_no)
         print(f"updated {self.long_descr} from ${self.price_1} to ${sale_price}")
 
     # def get_top_child_product(self):
@@ -370,6 +329,142 @@ class Product:
     #     return top_child
 
 
+class ProductCache:
+    """Bounded LRU cache of Products with a time to live per entry. Entries are dropped when the
+    setters write to an item, and optionally when a LST_MAINT_DT poll shows the item changed."""
+
+    def __init__(self, max_size=PRODUCT_CACHE_SIZE, ttl=PRODUCT_CACHE_TTL,
+                 poll_interval=PRODUCT_CACHE_POLL_INTERVAL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        # item_no -> (product, expires)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.last_poll = None
+        self.last_poll_check = 0
+
+    def get(self, item_no):
+        self.poll_if_due()
+        with self.lock:
+            entry = self.entries.get(item_no)
+            if entry is not None and entry[1] > time.monotonic():
+                self.entries.move_to_end(item_no)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self.entries[item_no]
+            self.misses += 1
+
+    def put(self, item_no, product):
+        with self.lock:
+            self.entries[item_no] = (product, time.monotonic() + self.ttl)
+            self.entries.move_to_end(item_no)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, item_no):
+        with self.lock:
+            self.entries.pop(item_no, None)
+
+    def invalidate_many(self, item_nos):
+        with self.lock:
+            for x in item_nos:
+                self.entries.pop(x, None)
+
+    def invalidate_binding(self, binding_key):
+        """Drops every cached product that shares a binding key"""
+        with self.lock:
+            for k in [k for k, v in self.entries.items() if v[0].binding_key == binding_key]:
+                del self.entries[k]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def poll_if_due(self):
+        if self.poll_interval is None or time.monotonic() - self.last_poll_check < self.poll_interval:
+            return
+        self.last_poll_check = time.monotonic()
+        self.poll_changes()
+
+    def poll_changes(self):
+        """Drops items whose item, price or inventory record changed since the last poll"""
+        response = db.query_db("SELECT GETDATE()")
+        poll_time = response[0][0]
+        if self.last_poll is not None:
+            query = """
+            SELECT ITEM_NO FROM IM_ITEM WHERE LST_MAINT_DT > ?
+            UNION SELECT ITEM_NO FROM IM_PRC WHERE LST_MAINT_DT > ?
+            UNION SELECT ITEM_NO FROM IM_INV WHERE LST_MAINT_DT > ?
+            """
+            response = db.query_db(query, (self.last_poll, self.last_poll, self.last_poll))
+            if response is not None:
+                self.invalidate_many([x[0] for x in response])
+        self.last_poll = poll_time
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self.entries)}
+
+
+product_cache = ProductCache()
+
+
+def get_product(item_no):
+    """Returns a Product from the cache, loading it on a miss"""
+    product = product_cache.get(item_no)
+    if product is None:
+        product = Product(item_no)
+        product_cache.put(item_no, product)
+    return product
+
+
+def get_products(item_nos):
+    """Returns {item_no: Product} for many SKUs. Cache misses are loaded together with Product.bulk_load."""
+    result = {}
+    missing = []
+    for x in item_nos:
+        product = product_cache.get(x)
+        if product is not None:
+            result[x] = product
+        else:
+            missing.append(x)
+    if missing:
+        for k, v in Product.bulk_load(missing).items():
+            product_cache.put(k, v)
+            result[k] = v
+    return result
+
+
+def get_child_variants(children, max_age=MIRROR_MAX_AGE):
+    """Returns Big Commerce variant info for a list of child Products, in the same order. Variants are
+    read from the catalog mirror, or one variant list call per parent product. Any that are not in the
+    list are fetched individually by a bounded pool of workers. max_age bounds the mirror's staleness
+    in seconds; None skips it."""
+    variants = {}
+    for product_id in dict.fromkeys(x.product_id for x in children if x.product_id):
+        for variant in bc_get_product_variants(product_id, max_age):
+            variants[(int(product_id), variant["id"])] = {"data": variant}
+
+    def variant_key(item):
+        if not item.product_id or not item.variant_id:
+            return None
+        return int(item.product_id), int(item.variant_id)
+
+    missing = [x for x in children if variant_key(x) not in variants]
+    if missing:
+        with ThreadPoolExecutor(max_workers=VARIANT_FETCH_WORKERS) as executor:
+            fetched = list(executor.map(lambda x: bc_get_variant(x.product_id, x.variant_id, max_age=max_age),
+                                        missing))
+        for item, info in zip(missing, fetched):
+            variants[variant_key(item) or item.item_no] = info
+
+    return [variants[variant_key(x) or x.item_no] for x in children]
+
+
 def get_ecomm_items(mode=1):
     # Mode 1 returns a total count of all e-comm items
     if mode == 1:
@@ -390,12 +485,11 @@ def get_ecomm_items(mode=1):
         FROM IM_ITEM
         WHERE IS_ECOMM_ITEM = 'Y'
         """
-        response = db.query_db(query)
-        if response is not None:
-            result = []
-            for x in response:
-                sku = x[0]
-                result.append(sku)
+        result = []
+        for x in db.query_stream(query):
+            sku = x[0]
+            result.append(sku)
+        if result:
             return result
 
     # Mode 3 returns a list of skus and bc product ID of single e-comm items, and unique binding keys
@@ -448,101 +542,77 @@ def get_ecomm_products_with_stock():
 
 
 def get_variant_names(binding_id):
-    query = f"""
-    SELECT ITEM_NO, USR_PROF_ALPHA_17
-    FROM IM_ITEM
-    WHERE USR_PROF_ALPHA_16 = '{binding_id}'
-    """
-    response = db.query_db(query)
-    result = []
-    if response is not None:
-        for x in response:
-            item_number = x[0]
-            variant_name = x[1]
-            result.append([item_number, variant_name])
+    result = catalog.variant_names(binding_id)
+    if result:
         return result
     else:
         return "No Variants with this ID"
 
 
 def get_variant_info_from_big(sku):
-    query = f"""
-    SELECT PRODUCT_ID, VARIANT_ID
-    FROM CPI_BC_PROD
-    WHERE WEB_ID = '1' AND SKU = '{sku}'
-    ORDER BY PRODUCT_ID
-    """
-    response = db.query_db(query)
+    response = bc_ids.variant_ids_for(sku)
     if response is not None:
-        product_id = int(response[0][0])
-        variant_id = int(response[0][1])
+        product_id = int(response[0])
+        variant_id = int(response[1])
         return bc_get_variant(product_id, variant_id)
 
 
 def get_binding_ids():
-    query = f"""
-    SELECT DISTINCT USR_PROF_ALPHA_16
-    FROM IM_ITEM
-    WHERE USR_PROF_ALPHA_16 IS NOT NULL
-    ORDER BY USR_PROF_ALPHA_16
-    """
-    result = []
-    response = db.query_db(query)
-    if response is not None:
-        for x in response:
-            result.append(x[0])
+    result = catalog.binding_ids()
+    if result:
         return result
-    else:
-        return
 
 
 def get_parent_product(binding_id):
-    query = f"""
-    SELECT ITEM_NO
-    FROM IM_ITEM
-    WHERE USR_PROF_ALPHA_16 = '{binding_id}' AND IS_ADM_TKT = 'Y'
-    """
-    response = db.query_db(query)
-    if response is not None:
+    response = catalog.items(binding_key=binding_id, is_parent="Y")
+    if response:
         if len(response) > 1:
-            result = []
-            for x in response:
-                result.append(x[0])
-            return result
+            return response
         else:
-            return response[0][0]
+            return response[0]
 
 
 def get_all_child_products(binding_id):
     """Returns a list of child product_tools for a binding ID"""
-    query = f"""
-    SELECT ITEM_NO
-    FROM IM_ITEM
-    WHERE USR_PROF_ALPHA_16 = '{binding_id}'    
-    """
-    response = db.query_db(query)
-    if response is not None:
-        child_products = []
-        for x in response:
-            child_products.append(x[0])
+    child_products = catalog.items(binding_key=binding_id)
+    if child_products:
         return child_products
 
 
 def get_merged_product_combined_stock(binding_id):
-    """"""
-    child_products = get_all_child_products(binding_id)
-    if child_products is not None:
-        if len(child_products) > 0:
-            combined_stock = 0
-            # Check each child for stock
-            for x in child_products:
-                item = Product(x)
-                combined_stock += item.buffered_quantity_available
-            return combined_stock
-        else:
-            return None
+    """Returns buffered stock summed over all children of a binding ID, or None if it has no children"""
+    return get_combined_stock([binding_id]).get(binding_id)
+
+
+def get_combined_stock(binding_ids=None):
+    """Returns {binding_id: buffered stock} summed over each binding ID's children in one aggregate
+    query, with each child clamped at zero. Pass None to get every binding ID in the catalog."""
+    query = """
+    SELECT ITEM.USR_PROF_ALPHA_16, SUM(CASE WHEN CHILD.STOCK < 0 THEN 0 ELSE CHILD.STOCK END)
+    FROM IM_ITEM ITEM
+    INNER JOIN IM_PRC PRC ON ITEM.ITEM_NO = PRC.ITEM_NO
+    LEFT OUTER JOIN IM_INV INV ON ITEM.ITEM_NO = INV.ITEM_NO
+    CROSS APPLY (
+        SELECT CAST(ISNULL(INV.QTY_AVAIL, 0) AS INT) - CAST(ISNULL(ITEM.PROF_NO_1, 0) AS INT) AS STOCK) CHILD
+    WHERE {binding_filter}
+    GROUP BY ITEM.USR_PROF_ALPHA_16
+    """
+    result = {}
+    if binding_ids is None:
+        batches = [None]
     else:
-        return None
+        binding_ids = list(dict.fromkeys(binding_ids))
+        batches = [binding_ids[i:i + BULK_LOAD_CHUNK_SIZE] for i in range(0, len(binding_ids), BULK_LOAD_CHUNK_SIZE)]
+    for batch in batches:
+        if batch is None:
+            binding_filter = "ITEM.USR_PROF_ALPHA_16 IS NOT NULL"
+            params = None
+        else:
+            binding_filter = f"ITEM.USR_PROF_ALPHA_16 IN ({', '.join('?' * len(batch))})"
+            params = tuple(batch)
+        for x in db.query_stream(query.format(binding_filter=binding_filter), params):
+            result[x[0]] = int(x[1])
+    return result
 
 
 # def get_items_with_no_sales_history():
@@ -562,15 +632,15 @@ def get_merged_product_combined_stock(binding_id):
 
 
 def get_new_items(start_date, end_date, min_price):
-    query = f"""
+    query = """
     SELECT ITEM.ITEM_NO
     FROM PO_RECVR_HIST_LIN REC
     INNER JOIN IM_ITEM ITEM ON ITEM.ITEM_NO = REC.ITEM_NO
-    WHERE RECVR_DAT >= '{start_date} 00:00:00.000' and RECVR_DAT <= '{end_date} 00:00:00.000' 
-    AND ITEM.PRC_1 >= '{min_price}'
+    WHERE RECVR_DAT >= ? and RECVR_DAT <= ?
+    AND ITEM.PRC_1 >= ?
     ORDER BY RECVR_DAT DESC
     """
-    response = db.query_db(query)
+    response = db.query_db(query, (f"{start_date} 00:00:00.000", f"{end_date} 00:00:00.000", min_price))
     if response is not None:
         result = []
         for x in response:
@@ -578,91 +648,44 @@ def get_new_items(start_date, end_date, min_price):
         return result
 
 
-def get_qty_sold_all_items():
-    """Produces a list of all items with the total number of quantity sold"""
-    query = f"""
-    "{creds.DATABASE}"."dbo"."USP_RPT_SA_BY_X";1 
-    'select distinct IM_ITEM.ITEM_NO as GRP_ID, IM_ITEM.DESCR as GRP_DESCR 
-    from IM_ITEM 
-    where ( (1=1) ) 
-    union select distinct VI_PS_TKT_HIST_LIN.ITEM_NO as GRP_ID, NULL as GRP_DESCR 
-    from %HISTORY% where not exists(select 1 from IM_ITEM 
-    where IM_ITEM.ITEM_NO = VI_PS_TKT_HIST_LIN.ITEM_NO) and ((VI_PS_TKT_HIST.STR_ID = ''1'')) and 
-    ( (1=1) ) and %ANYPERIODFILTER%', 'select VI_PS_TKT_HIST_LIN.ITEM_NO as GRP_ID, %HISTCOLUMNS% 
-    from %HISTORY% where ((VI_PS_TKT_HIST.STR_ID = ''1'')) and ( (1=1) ) and %PERIODFILTER%', ' 
-    (VI_PS_TKT_HIST.POST_DAT >= ''2020-01-01'') and (VI_PS_TKT_HIST.POST_DAT <= ''2024-02-18'')', ' 
-    (1=0) ', ' (1=0) ', 0, 0, 'SLS_QTY_A - RTN_QTY_VALID_A - RTN_QTY_NONVALID_A', 2
-    """
-    response = db.query_db(query)
-    if response is not None:
-        item_dict = {}
-        for x in response:
-            item_dict[x[0]] = int(x[2])
+def get_qty_sold_all_items(start_date="2020-01-01", end_date=None):
+    """Produces a list of all items with the total number of quantity sold between two dates.
+    End date defaults to today. Daily totals are cached locally, so only new days are queried."""
+    if end_date is None:
+        end_date = date.today()
+    item_dict = get_qty_sold(start_date, end_date)
+    if item_dict:
         return item_dict
 
 
 def update_total_sold():
-    """Update Big Commerce with 'total_sold' amounts"""
-    ecomm_items = get_ecomm_items(mode=3)
-    binding_ids = get_binding_ids()
-    qty_sold_all_items = get_qty_sold_all_items()
-    if ecomm_items is not None:
-        for x in ecomm_items:
-            count = 1
-            sku = x[0]
-            product_id = x[1]
-            if sku in binding_ids:
-                # Get all children
-                child_skus = get_all_child_products(sku)
-                # Calculate told sold all children
-                total_sold_all_children = 0
-                for y in child_skus:
-                    if y in qty_sold_all_items:
-                        total_sold_all_children += qty_sold_all_items[y]
-
-                if total_sold_all_children > 0:
-                    bc_update_product(product_id, {"total_sold": total_sold_all_children})
-                    print(f"#{count}/{len(ecomm_items)} Updated Item: {sku} to "
-                          f"Total Sold: {total_sold_all_children}")
-                    count += 1
-            else:
-                if sku in qty_sold_all_items:
-                    total_sold = qty_sold_all_items[sku]
-                    if total_sold > 0:
-                        bc_update_product(product_id, {"total_sold": total_sold})
-                        print(f"#{count}/{len(ecomm_items)} Updated Item: {sku} to Total Sold: {total_sold}")
-                        count += 1
+    """Update Big Commerce with 'total_sold' amounts. Only products whose total changed since the
+    last run are sent."""
+    from setup.sync_engine import TotalSoldSync
+    return TotalSoldSync().run()
+
+
+def search(query, filters=None, limit=25):
+    """Searches item descriptions and custom fields. Returns a ranked list of matching items.
+    Filters narrow by category, subcategory, binding_key, is_parent or is_ecomm."""
+    return search_index.search(query, filters, limit)
 
 
 def get_products_by_category(category, subcat="", ecomm_only=False):
-    subcat_filter = ""
-    ecomm_filter = ""
+    filters = {"category": category}
     if subcat != "":
-        subcat_filter = f"AND SUBCAT_COD = '{subcat}'"
+        filters["subcategory"] = subcat
     if ecomm_only:
-        ecomm_filter = "AND IS_ECOMM_ITEM = 'Y'"
-    query = f"""
-    SELECT ITEM_NO
-    FROM IM_ITEM
-    WHERE CATEG_COD = '{category}' {subcat_filter} {ecomm_filter}
-    """
-    response = db.query_db(query)
-    if response is not None:
-        items = []
-        for x in response:
-            items.append(x[0])
+        filters["is_ecomm"] = "Y"
+    items = catalog.items(**filters)
+    if items:
         return items
 
 
 def get_bc_product_id(sku):
-    query = f"""
-    SELECT PRODUCT_ID
-    FROM CPI_BC_PROD
-    WHERE WEB_ID = '1' AND SKU = '{sku}'
-    """
-    response = db.query_db(query)
+    response = bc_ids.variant_ids_for(sku)
     if response is not None:
-        return int(response[0][0])
+        return int(response[0])
 
 
 def get_product_categories_cp():
@@ -678,61 +701,101 @@ def get_product_categories_cp():
         return categories
 
 
-def fix_html_trash():
-    query = f"""
-    SELECT ITEM_NO, HTML_DESCR
-    FROM EC_ITEM_DESCR
-    WHERE HTML_DESCR like '%<div%'
-    """
-    response = db.query_db(query)
-    if response is not None:
-        items = []
+def fix_html_trash(write_back_to_cp=False):
+    """Removes trash before the opening <p> tag of descriptions and logs them. Optionally writes
+    the cleaned descriptions back to Counterpoint."""
+    return description_engine.fix_html_trash(write_back_to_cp)
 
-        for x in response:
-            items.append([x[0], x[1]])
 
-        for y in items:
-            for letter in range(len(y[1]) - 1):
-                result = []
-                # FIX TRASH BEFORE OPENING <p> TAG
-                if y[1][letter] == '<' and y[1][letter + 1] == 'p' and y[1][letter + 2] == '>':
-                    result.append([y[0], y[1][letter:]])
-                    log_data = [
-                        [y[0], (y[1][letter:]).strip().replace("\n", "").replace("\r", "").replace("&nbsp;", "")]]
-                    df = pandas.DataFrame(log_data, columns=["item_no", "html_description"])
-                    df.to_csv(creds.description_log, mode='a', header=False, index=False)
-                    break
+def export_html_descr():
+    return description_engine.export_html_descr()
 
 
-def export_html_descr():
-    log = creds.description_log
-    query = f"""
-    SELECT ITEM_NO, HTML_DESCR
-    FROM EC_ITEM_DESCR
-    WHERE HTML_DESCR IS NOT NULL
-    """
+def set_sale_price(query, discount_percentage):
+    """takes a sql query and discount percentage and sets PRC_2 and updates lst_modified."""
     response = db.query_db(query)
     if response is not None:
-        items = []
+        result = set_sale_prices({x[0]: discount_percentage for x in response})
+        updated = [k for k, v in result.items() if v["code"] == 200]
+        print(f"Updated sale price for {len(updated)}/{len(result)} items to {discount_percentage}% off")
+        for k, v in result.items():
+            if v["code"] != 200:
+                print(f"{k}: failed to update sale price. {v['message']}")
+        return result
 
-        for x in response:
-            items.append([x[0], x[1]])
-
-        for y in items:
-            log_data = [[y[0], (y[1]).strip().replace("\n", "").replace("\r", "").replace("&nbsp;", "")]]
-            df = pandas.DataFrame(log_data, columns=["item_no", "html_description"])
-            try:
-                pandas.read_csv(log)
-            except FileNotFoundError:
-                df.to_csv(log, mode='a', header=True, index=False)
+
+def set_sale_prices(discounts, chunk_size=MUTATION_CHUNK_SIZE):
+    """Sets PRC_2 from PRC_1 for many items with a single UPDATE per chunk. Takes {item_no: discount
+    percentage}. Items the UPDATE did not touch are found from its OUTPUT clause.
+    Returns {item_no: result}."""
+    items = list(discounts.items())
+    result = {}
+    for i in range(0, len(items), chunk_size):
+        chunk = items[i:i + chunk_size]
+        placeholders = ", ".join("(?, ?)" for x in chunk)
+        # OUTPUT goes into a table variable since IM_PRC has triggers
+        query = f"""
+        SET NOCOUNT ON
+        DECLARE @CHANGES TABLE (KEY_VALUE VARCHAR(50))
+        UPDATE PRC
+        SET PRC.PRC_2 = ROUND(ITEM.PRC_1 * (100 - CAST(CHANGES.DISCOUNT AS DECIMAL(15, 4))) / 100, 2),
+        PRC.LST_MAINT_DT = GETDATE()
+        OUTPUT CHANGES.KEY_VALUE INTO @CHANGES
+        FROM IM_PRC PRC
+        INNER JOIN IM_ITEM ITEM ON ITEM.ITEM_NO = PRC.ITEM_NO
+        INNER JOIN (VALUES {placeholders}) CHANGES (KEY_VALUE, DISCOUNT) ON PRC.ITEM_NO = CHANGES.KEY_VALUE
+        SELECT KEY_VALUE FROM @CHANGES
+        """
+        params = []
+        for item_no, discount in chunk:
+            params.extend((item_no, discount))
+        response = db.query_returning(query, tuple(params))
+        if isinstance(response, dict):
+            for item_no, discount in chunk:
+                result[item_no] = response
+            continue
+        updated = {x[0] for x in response}
+        for item_no, discount in chunk:
+            if item_no in updated:
+                result[item_no] = {"code": 200, "message": "Query Successful"}
             else:
-                df.to_csv(log, mode='a', header=False, index=False)
+                result[item_no] = {"code": 404, "message": "No matching item"}
+    product_cache.invalidate_many(discounts)
+    return result
 
 
-def set_sale_price(query, discount_percentage):
-    """takes a sql query and discount percentage and sets PRC_2 and updates lst_modified."""
-    response = db.query_db(query)
-    if response is not None:
-        for x in response:
-            item = Product(x[0])
-            item.set_sale_price(discount=discount_percentage)
+def set_item_values(column, values, value_type, status_col_name, log_location, key_column="ITEM_NO",
+                    condition="1=1"):
+    """Sets one IM_ITEM column for many items in one statement per chunk and logs the changes in one batch.
+    Takes {key: value}. Returns {item_no: result} for updated items and {key: result} for failures."""
+    changes, errors = update_items(column, values, value_type, key_column, condition)
+    log_changes(changes, errors, values, status_col_name, log_location)
+    product_cache.invalidate_many([x["item_no"] for x in changes])
+    if key_column == "USR_PROF_ALPHA_16":
+        for binding_key in values:
+            product_cache.invalidate_binding(binding_key)
+    result = {x["item_no"]: {"code": 200, "message": "Query Successful", **x} for x in changes}
+    result.update(errors)
+    return result
+
+
+def set_buffers(buffers):
+    """Sets the e-comm buffer for many items. Takes {item_no: buffer}."""
+    return set_item_values("PROF_NO_1", buffers, "DECIMAL(15, 4)", "buffer", creds.buffer_log)
+
+
+def set_sort_orders(sort_orders):
+    """Sets the web sort order for many items. Takes {item_no: sort order}."""
+    return set_item_values("USR_PROF_ALPHA_27", {k: str(v) for k, v in sort_orders.items()},
+                           "VARCHAR(30)", "sort_order", creds.sort_order_log)
+
+
+def set_featured_items(statuses):
+    """Sets the featured flag for many items. Takes {item_no: 'Y' or 'N'}."""
+    return set_item_values("ECOMM_NEW", statuses, "VARCHAR(1)", "featured", creds.featured_products)
+
+
+def set_featured_bindings(statuses):
+    """Sets the featured flag on the parents of merged products. Takes {binding_key: 'Y' or 'N'}."""
+    return set_item_values("ECOMM_NEW", statuses, "VARCHAR(1)", "featured", creds.featured_products,
+                           key_column="USR_PROF_ALPHA_16", condition="ITEM.IS_ADM_TKT = 'Y'")
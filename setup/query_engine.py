@@ -4,72 +4,466 @@ from pyodbc import ProgrammingError, Error
 import requests
 import json
 from setup import creds
+import threading
 import time
+from collections import deque
 
+import pandas
 
-class QueryEngine:
-    def __init__(self):
-        self.__SERVER = SERVER
-        self.__DATABASE = DATABASE
-        self.__USERNAME = USERNAME
-        self.__PASSWORD = PASSWORD
-
-    def query_db(self, query, commit=False):
-        """Runs Query Against SQL Database. Use Commit Kwarg for updating database"""
-        connection = pyodbc.connect(
-            f"DRIVER={{ODBC Driver 18 for SQL Server}};SERVER={self.__SERVER};PORT=1433;DATABASE={self.__DATABASE};"
-            f"UID={self.__USERNAME};PWD={self.__PASSWORD};TrustServerCertificate=yes;timeout=3"
-        )
+# Connection Pool Settings
+POOL_MIN_SIZE = 1
+POOL_MAX_SIZE = 10
+# Seconds to wait for a free connection when the pool is at its max size
+POOL_CHECKOUT_TIMEOUT = 15
+# Idle connections above the min size are closed after this many seconds
+POOL_IDLE_TIMEOUT = 300
+# Connections idle longer than this many seconds are checked with SELECT 1 on checkout
+POOL_VALIDATE_AFTER = 30
+
+# Rows per fetchmany call in streaming mode
+STREAM_CHUNK_SIZE = 1000
+
+# Bulk writes are retried this many times on deadlock, waiting DEADLOCK_BACKOFF * attempt seconds
+DEADLOCK_RETRIES = 3
+DEADLOCK_BACKOFF = 1
+
+# SQLSTATE codes that mean the connection itself is gone
+DISCONNECT_STATES = {"08S01", "08S02", "08001", "08003", "08004", "08007"}
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+def is_disconnect(error):
+    return len(error.args) > 0 and error.args[0] in DISCONNECT_STATES
+
+
+def is_deadlock(error):
+    return len(error.args) > 0 and error.args[0] == "40001"
+
+
+def error_result(error):
+    return {"code": f"{error.args[0]}", "message": f"{error.args[1] if len(error.args) > 1 else error}"}
+
+
+class ConnectionPool:
+    """Thread-safe pool of pyodbc connections shared by Waitress request threads and the consumers"""
+
+    def __init__(self, connection_string, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE,
+                 checkout_timeout=POOL_CHECKOUT_TIMEOUT, idle_timeout=POOL_IDLE_TIMEOUT,
+                 validate_after=POOL_VALIDATE_AFTER):
+        self.connection_string = connection_string
+        self.min_size = min_size
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.idle_timeout = idle_timeout
+        self.validate_after = validate_after
+        # (connection, last used) pairs. Most recently used at the right.
+        self.idle = deque()
+        # Open connections, idle and checked out
+        self.size = 0
+        self.condition = threading.Condition()
+        self.counters = {
+            "checkouts": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "created": 0,
+            "closed": 0,
+            "validation_failures": 0,
+            "reconnects": 0,
+        }
+
+    def create(self):
+        connection = pyodbc.connect(self.connection_string)
         connection.setdecoding(pyodbc.SQL_CHAR, encoding="latin1")
         connection.setencoding("latin1")
+        with self.condition:
+            self.counters["created"] += 1
+        return connection
+
+    def close(self, connection):
+        try:
+            connection.close()
+        except Error:
+            pass
+        with self.condition:
+            self.counters["closed"] += 1
+
+    def validate(self, connection):
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT 1").fetchall()
+            cursor.close()
+        except Error:
+            return False
+        return True
+
+    def evict_idle(self):
+        """Takes connections idle past the idle timeout out of the pool. Caller holds the condition."""
+        expired = []
+        now = time.monotonic()
+        while self.idle and self.size > self.min_size and now - self.idle[0][1] > self.idle_timeout:
+            expired.append(self.idle.popleft()[0])
+            self.size -= 1
+        return expired
 
-        cursor = connection.cursor()
+    def acquire(self):
+        deadline = time.monotonic() + self.checkout_timeout
+        with self.condition:
+            self.counters["checkouts"] += 1
+            expired = self.evict_idle()
+            waited = False
+            while True:
+                if self.idle:
+                    connection, last_used = self.idle.pop()
+                    break
+                if self.size < self.max_size:
+                    self.size += 1
+                    connection, last_used = None, None
+                    break
+                if not waited:
+                    self.counters["waits"] += 1
+                    waited = True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.counters["timeouts"] += 1
+                    raise PoolTimeout(f"No database connection free after {self.checkout_timeout} seconds")
+                self.condition.wait(remaining)
+
+        for x in expired:
+            self.close(x)
+
+        if connection is not None and time.monotonic() - last_used > self.validate_after:
+            if not self.validate(connection):
+                with self.condition:
+                    self.counters["validation_failures"] += 1
+                self.close(connection)
+                connection = None
+
+        if connection is None:
+            try:
+                connection = self.create()
+            except Exception:
+                with self.condition:
+                    self.size -= 1
+                    self.condition.notify()
+                raise
+        return connection
+
+    def release(self, connection):
+        # Ends the transaction a SELECT leaves open so the next user starts clean
+        try:
+            connection.rollback()
+        except Error:
+            self.discard(connection)
+            return
+        with self.condition:
+            self.idle.append((connection, time.monotonic()))
+            self.condition.notify()
+
+    def discard(self, connection):
+        self.close(connection)
+        with self.condition:
+            self.size -= 1
+            self.condition.notify()
+
+    def run(self, work, retry=True):
+        """Calls work(connection) with a pooled connection. If the connection turns out to be dead,
+        it is dropped and the work is retried once on a new connection. Pass retry=False for writes,
+        since the server may have committed before the connection dropped."""
+        for attempt in range(2):
+            connection = self.acquire()
+            try:
+                result = work(connection)
+            except Error as e:
+                if is_disconnect(e):
+                    self.discard(connection)
+                    if retry and attempt == 0:
+                        with self.condition:
+                            self.counters["reconnects"] += 1
+                        print("Database connection lost. Reconnecting...")
+                        continue
+                    raise
+                self.release(connection)
+                raise
+            except BaseException:
+                self.discard(connection)
+                raise
+            else:
+                self.release(connection)
+                return result
+
+    def stats(self):
+        with self.condition:
+            result = dict(self.counters)
+            result["size"] = self.size
+            result["idle"] = len(self.idle)
+            result["in_use"] = self.size - len(self.idle)
+            return result
+
+
+pool = ConnectionPool(
+    f"DRIVER={{ODBC Driver 18 for SQL Server}};SERVER={SERVER};PORT=1433;DATABASE={DATABASE};"
+    f"UID={USERNAME};PWD={PASSWORD};TrustServerCertificate=yes;timeout=3"
+)
+
+
+def pool_stats():
+    """Returns checkout, wait and creation counts for the shared connection pool"""
+    return pool.stats()
+
+
+def run_query(connection, query, params=None, commit=False):
+    cursor = connection.cursor()
+    # Parameters are sent separately from the statement text so SQL Server can reuse one plan
+    # for every value instead of compiling an ad-hoc plan per literal
+    args = (query, params) if params else (query,)
+    try:
         if commit:
             try:
-                cursor.execute(query)
+                cursor.execute(*args)
                 connection.commit()
             except ProgrammingError as e:
+                connection.rollback()
                 sql_data = {"code": f"{e.args[0]}", "message": f"{e.args[1]}"}
             except Error as e:
+                if is_disconnect(e):
+                    raise
+                connection.rollback()
                 if e.args[0] == "40001":
                     print("Deadlock Detected. Retrying Query")
                     time.sleep(1)
-                    cursor.execute(query)
+                    cursor.execute(*args)
                     connection.commit()
+                    sql_data = {"code": 200, "message": "Query Successful"}
                 else:
                     sql_data = {"code": f"{e.args[0]}", "message": f"{e.args[1]}"}
             else:
                 sql_data = {"code": 200, "message": "Query Successful"}
         else:
             try:
-                sql_data = cursor.execute(query).fetchall()
+                sql_data = cursor.execute(*args).fetchall()
             except ProgrammingError as e:
                 sql_data = {"code": f"{e.args[0]}", "message": f"{e.args[1]}"}
+    finally:
+        cursor.close()
+    return sql_data if sql_data else None
+
+
+def stream_query(connection_pool, query, params=None, chunk_size=STREAM_CHUNK_SIZE):
+    """Yields (column names, rows) for each fetchmany chunk. The pooled connection is held until the
+    generator is exhausted or closed."""
+    connection = connection_pool.acquire()
+    cursor = connection.cursor()
+    try:
+        if params:
+            cursor.execute(query, params)
+        else:
+            cursor.execute(query)
+        columns = [x[0] for x in cursor.description] if cursor.description else []
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield columns, rows
+    except Error as e:
+        cursor.close()
+        if is_disconnect(e):
+            connection_pool.discard(connection)
+        else:
+            connection_pool.release(connection)
+        raise
+    except BaseException:
+        # Includes GeneratorExit when the caller stops early
+        cursor.close()
+        connection_pool.release(connection)
+        raise
+    else:
+        cursor.close()
+        connection_pool.release(connection)
+
+
+def run_many(connection, query, rows):
+    """Sends every row in one executemany batch and commits them together"""
+    cursor = connection.cursor()
+    cursor.fast_executemany = True
+    try:
+        cursor.executemany(query, rows)
+        connection.commit()
+    finally:
+        cursor.close()
+    return [{"code": 200, "message": "Query Successful"} for x in rows]
+
+
+def run_each(connection, query, rows):
+    """Runs rows one at a time in a single transaction so a failing row does not stop the others"""
+    cursor = connection.cursor()
+    results = []
+    try:
+        for row in rows:
+            try:
+                cursor.execute(query, row)
+            except Error as e:
+                if is_disconnect(e) or is_deadlock(e):
+                    raise
+                results.append(error_result(e))
+                continue
+            if cursor.rowcount == 0:
+                results.append({"code": 404, "message": "No rows matched", "rowcount": 0})
+            else:
+                results.append({"code": 200, "message": "Query Successful", "rowcount": cursor.rowcount})
+        connection.commit()
+    finally:
+        cursor.close()
+    return results
 
+
+def run_returning(connection, query, params=None):
+    """Runs a write that returns rows, such as an UPDATE with an OUTPUT clause, and commits it"""
+    cursor = connection.cursor()
+    args = (query, params) if params else (query,)
+    try:
+        cursor.execute(*args)
+        # Skip row counts from statements before the result set
+        while cursor.description is None and cursor.nextset():
+            pass
+        rows = cursor.fetchall() if cursor.description is not None else []
+        connection.commit()
+    finally:
         cursor.close()
-        connection.close()
-        return sql_data if sql_data else None
+    return rows
+
+
+class QueryEngine:
+    def __init__(self):
+        self.pool = pool
+
+    def query_db(self, query, params=None, commit=False):
+        """Runs Query Against SQL Database. Use ? placeholders with a params tuple for values.
+        Use Commit Kwarg for updating database"""
+        return self.pool.run(lambda connection: run_query(connection, query, params, commit), retry=not commit)
+
+    def execute_many(self, query, rows, retries=DEADLOCK_RETRIES):
+        """Runs one statement for every params tuple in rows as a single fast_executemany batch in
+        one transaction. Returns a {"code", "message"} result per row, in the order of rows.
+        If the batch fails, it is rolled back and the rows are run individually to find the failing ones.
+        executemany does not report row counts, so an UPDATE row that matches nothing still gets 200.
+        Writes that need to know which keys matched should join a VALUES list and read back an OUTPUT
+        clause instead, as mutation_engine.update_items does."""
+        rows = [tuple(x) for x in rows]
+        if not rows:
+            return []
+        try:
+            return self.retry_deadlocks(lambda connection: run_many(connection, query, rows), retries)
+        except Error as e:
+            if is_disconnect(e) or is_deadlock(e):
+                return [error_result(e) for x in rows]
+            print(f"Bulk write failed ({e.args[0]}). Retrying rows individually")
+        try:
+            return self.retry_deadlocks(lambda connection: run_each(connection, query, rows), retries)
+        except Error as e:
+            return [error_result(e) for x in rows]
+
+    def query_returning(self, query, params=None, retries=DEADLOCK_RETRIES):
+        """Runs a write that returns rows in its own transaction. Returns the rows, or a
+        {"code", "message"} result if the statement fails."""
+        try:
+            return self.retry_deadlocks(lambda connection: run_returning(connection, query, params), retries)
+        except Error as e:
+            return error_result(e)
+
+    def retry_deadlocks(self, work, retries=DEADLOCK_RETRIES):
+        """Runs a write, retrying deadlocks. A dropped connection is not retried."""
+        for attempt in range(retries + 1):
+            try:
+                return self.pool.run(work, retry=False)
+            except Error as e:
+                if not is_deadlock(e) or attempt == retries:
+                    raise
+                print(f"Deadlock Detected. Retrying Batch ({attempt + 1}/{retries})")
+                time.sleep(DEADLOCK_BACKOFF * (attempt + 1))
+
+    def query_stream(self, query, params=None, chunk_size=STREAM_CHUNK_SIZE):
+        """Yields result rows one at a time, fetched from SQL Server in chunks, so memory stays
+        bounded by the chunk size rather than the size of the result"""
+        for columns, rows in stream_query(self.pool, query, params, chunk_size):
+            yield from rows
+
+    def query_chunks(self, query, params=None, chunk_size=STREAM_CHUNK_SIZE):
+        """Yields result rows as lists of up to chunk_size rows"""
+        for columns, rows in stream_query(self.pool, query, params, chunk_size):
+            yield rows
+
+    def query_dataframes(self, query, params=None, chunk_size=STREAM_CHUNK_SIZE):
+        """Yields each chunk of result rows as a DataFrame named by the query's columns"""
+        for columns, rows in stream_query(self.pool, query, params, chunk_size):
+            yield pandas.DataFrame.from_records([tuple(x) for x in rows], columns=columns)
 
     def lookup_customer_by_email(self, email_address):
-        query = f"""
+        query = """
         SELECT TOP 1 CUST_NO
         FROM AR_CUST
-        WHERE EMAIL_ADRS_1 = '{email_address}' or EMAIL_ADRS_2 = '{email_address}'
+        WHERE EMAIL_ADRS_1 = ? or EMAIL_ADRS_2 = ?
         """
-        response = self.query_db(query)
+        response = self.query_db(query, (email_address, email_address))
         if response is not None:
             return response[0][0]
 
     def lookup_customer_by_phone(self, phone_number):
-        query = f"""
+        query = """
         SELECT TOP 1 CUST_NO
         FROM AR_CUST
-        WHERE PHONE_1 = '{phone_number}' or MBL_PHONE_1 = '{phone_number}'
+        WHERE PHONE_1 = ? or MBL_PHONE_1 = ?
         """
-        response = self.query_db(query)
+        response = self.query_db(query, (phone_number, phone_number))
         if response is not None:
             return response[0][0]
 
+    def lookup_customer_name(self, phone_number):
+        """Returns (first name, last name, category) for a Counterpoint formatted phone number"""
+        query = """
+        SELECT FST_NAM, LST_NAM, CATEG_COD
+        FROM AR_CUST
+        WHERE PHONE_1 = ?
+        """
+        response = self.query_db(query, (phone_number,))
+        if response is not None:
+            return response[0][0], response[0][1], response[0][2]
+
+    def lookup_document_id(self, ticket_number):
+        query = """
+        SELECT DOC_ID
+        FROM PS_TKT_HIST
+        WHERE TKT_NO = ?
+        """
+        response = self.query_db(query, (ticket_number,))
+        if response is not None:
+            return response[0][0]
+
+    def lookup_product_id(self, item_no):
+        """Returns the Big Commerce product ID for an item number or binding key"""
+        query = """
+        SELECT TOP 1 PRODUCT_ID FROM CPI_BC_PRODUCTS
+        WHERE ITEM_NO = ? AND WEB_ID = '1'
+        ORDER BY CREATE_DATE DESC
+        """
+        response = self.query_db(query, (item_no,))
+        if response is not None:
+            return response[0][0]
+
+    def lookup_variant_ids(self, sku):
+        """Returns (product ID, variant ID) for a SKU from the Big Commerce product table"""
+        query = """
+        SELECT PRODUCT_ID, VARIANT_ID
+        FROM CPI_BC_PROD
+        WHERE WEB_ID = '1' AND SKU = ?
+        ORDER BY PRODUCT_ID
+        """
+        response = self.query_db(query, (sku,))
+        if response is not None:
+            return response[0][0], response[0][1]
+
     def is_customer(self, email_address, phone_number):
         """Checks to see if an email or phone number belongs to a current customer"""
         return (
@@ -123,15 +517,8 @@ def add_new_customer(
 
 
 def get_document_id(ticket_number):
-    query = f"""
-    SELECT DOC_ID
-    FROM PS_TKT_HIST
-    WHERE TKT_NO = '{ticket_number}'
-    """
     db = QueryEngine()
-    response = db.query_db(query)
-    if response is not None:
-        return response[0][0]
+    return db.lookup_document_id(ticket_number)
 
 
 def add_ticket_notes(ticket_number, note_id, note):
@@ -0,0 +1,174 @@
+import sqlite3
+import threading
+from contextlib import closing
+from datetime import date, datetime, timedelta
+
+import numpy
+
+from setup import creds
+from setup.query_engine import QueryEngine
+
+db = QueryEngine()
+
+# Local cache of quantity sold per item per day
+SALES_STORE = "./sales_history.sqlite3"
+# Most days requested from Counterpoint in one query
+SALES_FETCH_DAYS = 90
+
+
+def to_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value)[:10], "%Y-%m-%d").date()
+
+
+def fetch_daily_qty_sold(start_date, end_date):
+    """Runs the Counterpoint sales by item report once for a date range, grouped by post date and item.
+    Returns {day: {item_no: quantity sold}} for every day in the range. Days without sales have no items."""
+    start_date, end_date = to_date(start_date), to_date(end_date)
+    # The report's group ID is the post date and item number, so one call returns daily totals with
+    # the report's own quantity measure (sales less valid and non-valid returns)
+    group_id = "CONVERT(VARCHAR(10), VI_PS_TKT_HIST.POST_DAT, 23) + ''|'' + VI_PS_TKT_HIST_LIN.ITEM_NO"
+    query = f"""
+    "{creds.DATABASE}"."dbo"."USP_RPT_SA_BY_X";1 
+    'select distinct {group_id} as GRP_ID, NULL as GRP_DESCR 
+    from %HISTORY% where ((VI_PS_TKT_HIST.STR_ID = ''1'')) and ( (1=1) ) and %ANYPERIODFILTER%', 
+    'select {group_id} as GRP_ID, %HISTCOLUMNS% 
+    from %HISTORY% where ((VI_PS_TKT_HIST.STR_ID = ''1'')) and ( (1=1) ) and %PERIODFILTER%', ' 
+    (VI_PS_TKT_HIST.POST_DAT >= ''{start_date.isoformat()}'') and 
+    (VI_PS_TKT_HIST.POST_DAT <= ''{end_date.isoformat()}'')', ' 
+    (1=0) ', ' (1=0) ', 0, 0, 'SLS_QTY_A - RTN_QTY_VALID_A - RTN_QTY_NONVALID_A', 2
+    """
+    days = {}
+    day = start_date
+    while day <= end_date:
+        days[day] = {}
+        day += timedelta(days=1)
+    for x in db.query_stream(query):
+        if x[2]:
+            post_date, item_no = x[0].split("|", 1)
+            days[to_date(post_date)][item_no] = int(x[2])
+    return days
+
+
+class SalesStore:
+    """Per-day, per-item quantities sold, cached in SQLite and held in memory as NumPy arrays.
+    Only days that have not been fetched after they ended are requested from Counterpoint, so today,
+    and a day fetched while it was still today, are fetched again since their sales were not final."""
+
+    def __init__(self, location=SALES_STORE):
+        self.location = location
+        self.lock = threading.Lock()
+        # Item numbers and their positions in the daily arrays
+        self.items = []
+        self.item_index = {}
+        # day -> (item positions, quantities)
+        self.days = {}
+        # Days fetched after they ended. Any other day in self.days is fetched again.
+        self.final_days = set()
+        self.create_tables()
+        self.load()
+
+    def connect(self):
+        return closing(sqlite3.connect(self.location))
+
+    def create_tables(self):
+        with self.connect() as connection, connection:
+            connection.execute("""
+            CREATE TABLE IF NOT EXISTS DAILY_QTY (
+            DAY TEXT NOT NULL, ITEM_NO TEXT NOT NULL, QTY INTEGER NOT NULL, PRIMARY KEY (DAY, ITEM_NO))
+            """)
+            connection.execute("CREATE TABLE IF NOT EXISTS FETCHED_DAYS (DAY TEXT PRIMARY KEY)")
+
+    def load(self):
+        with self.connect() as connection:
+            fetched = [x[0] for x in connection.execute("SELECT DAY FROM FETCHED_DAYS")]
+            rows = connection.execute("SELECT DAY, ITEM_NO, QTY FROM DAILY_QTY ORDER BY DAY").fetchall()
+        by_day = {x: {} for x in fetched}
+        for day, item_no, qty in rows:
+            if day in by_day:
+                by_day[day][item_no] = qty
+        with self.lock:
+            for day, quantities in by_day.items():
+                self.set_day(date.fromisoformat(day), quantities)
+            self.final_days.update(date.fromisoformat(x) for x in fetched)
+
+    def position(self, item_no):
+        if item_no not in self.item_index:
+            self.item_index[item_no] = len(self.items)
+            self.items.append(item_no)
+        return self.item_index[item_no]
+
+    def set_day(self, day, quantities):
+        positions = numpy.fromiter((self.position(x) for x in quantities), dtype=numpy.int64, count=len(quantities))
+        values = numpy.fromiter(quantities.values(), dtype=numpy.int64, count=len(quantities))
+        self.days[day] = (positions, values)
+
+    def update(self, start_date, end_date):
+        """Fetches the days in the range that are not cached yet"""
+        start_date, end_date = to_date(start_date), to_date(end_date)
+        today = date.today()
+        day = start_date
+        missing = []
+        while day <= min(end_date, today):
+            if day not in self.final_days:
+                missing.append(day)
+            day += timedelta(days=1)
+        # Consecutive missing days are fetched together, a chunk at a time
+        ranges = []
+        for day in missing:
+            if ranges and day == ranges[-1][1] + timedelta(days=1) and (day - ranges[-1][0]).days < SALES_FETCH_DAYS:
+                ranges[-1][1] = day
+            else:
+                ranges.append([day, day])
+        for i, (first_day, last_day) in enumerate(ranges, start=1):
+            days = fetch_daily_qty_sold(first_day, last_day)
+            self.save_days(days, today)
+            with self.lock:
+                for day, quantities in days.items():
+                    self.set_day(day, quantities)
+                self.final_days.update(x for x in days if x < today)
+            if len(ranges) > 1:
+                print(f"Sales history: fetched {first_day} to {last_day} ({i}/{len(ranges)})")
+
+    def save_days(self, days, today):
+        """Saves {day: {item_no: quantity}}. Days before today are marked fetched."""
+        with self.connect() as connection, connection:
+            for day, quantities in days.items():
+                connection.execute("DELETE FROM DAILY_QTY WHERE DAY = ?", (day.isoformat(),))
+                connection.executemany("INSERT INTO DAILY_QTY (DAY, ITEM_NO, QTY) VALUES (?, ?, ?)",
+                                       [(day.isoformat(), k, v) for k, v in quantities.items()])
+                if day < today:
+                    connection.execute("INSERT OR IGNORE INTO FETCHED_DAYS (DAY) VALUES (?)", (day.isoformat(),))
+
+    def qty_sold(self, start_date, end_date):
+        """Returns {item_no: quantity sold} between two dates (inclusive), fetching only new days"""
+        start_date, end_date = to_date(start_date), to_date(end_date)
+        self.update(start_date, end_date)
+        with self.lock:
+            arrays = [v for k, v in self.days.items() if start_date <= k <= end_date]
+            if not arrays:
+                return {}
+            positions = numpy.concatenate([x[0] for x in arrays])
+            values = numpy.concatenate([x[1] for x in arrays])
+            totals = numpy.bincount(positions, weights=values, minlength=len(self.items))
+            return {self.items[i]: int(totals[i]) for i in numpy.flatnonzero(totals)}
+
+
+sales_store = None
+sales_store_lock = threading.Lock()
+
+
+def get_sales_store():
+    global sales_store
+    with sales_store_lock:
+        if sales_store is None:
+            sales_store = SalesStore()
+        return sales_store
+
+
+def get_qty_sold(start_date, end_date):
+    """Returns {item_no: quantity sold} for a date range from the local sales store"""
+    return get_sales_store().qty_sold(start_date, end_date)
@@ -0,0 +1,127 @@
+import bisect
+import re
+import threading
+
+from setup.catalog_engine import catalog
+
+# Searchable catalog columns and how much a match in each counts toward the rank
+SEARCH_FIELDS = {
+    "web_title": 3,
+    "long_descr": 3,
+    "descr": 2,
+    "search_key": 2,
+    "botanical_name": 2,
+    "brand": 1,
+    "plant_type": 1,
+    "bloom_time": 1,
+    "flower_color": 1,
+    "variant_name": 1,
+}
+# Prefix matches count for less than whole-word matches
+PREFIX_MATCH_WEIGHT = 0.5
+SEARCH_RESULT_LIMIT = 25
+
+TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    if text is None:
+        return []
+    return TOKEN.findall(str(text).lower())
+
+
+class SearchIndex:
+    """Inverted index over the catalog snapshot's text columns. Tokens are kept in a sorted list so
+    prefixes are found with a binary search. The index catches up with the snapshot's updates on
+    every search and is rebuilt when the snapshot is reloaded."""
+
+    def __init__(self, snapshot=catalog):
+        self.snapshot = snapshot
+        self.lock = threading.Lock()
+        self.generation = None
+        self.offset = 0
+        # token -> {position: weight}
+        self.postings = {}
+        self.tokens = []
+        # position -> {token: weight}, to remove an item's old tokens when it changes
+        self.documents = {}
+
+    def reset(self):
+        self.postings = {}
+        self.tokens = []
+        self.documents = {}
+        self.offset = 0
+
+    def index_position(self, position):
+        for token in self.documents.pop(position, {}):
+            self.postings[token].pop(position, None)
+        weights = {}
+        for field, weight in SEARCH_FIELDS.items():
+            for token in tokenize(self.snapshot.columns[field][position]):
+                weights[token] = max(weights.get(token, 0), weight)
+        for token, weight in weights.items():
+            if token not in self.postings:
+                self.postings[token] = {}
+                bisect.insort(self.tokens, token)
+            self.postings[token][position] = weight
+        self.documents[position] = weights
+
+    def sync(self):
+        """Indexes the positions the snapshot has set since the last sync"""
+        self.snapshot.ensure_fresh()
+        with self.snapshot.lock:
+            if self.generation != self.snapshot.generation:
+                self.reset()
+                self.generation = self.snapshot.generation
+            updates = self.snapshot.updates
+            if self.offset < len(updates):
+                for position in set(updates[self.offset:]):
+                    self.index_position(position)
+                self.offset = len(updates)
+
+    def matches(self, term):
+        """Returns {position: score} for one query term, by whole word or prefix"""
+        scores = {}
+        start = bisect.bisect_left(self.tokens, term)
+        for i in range(start, len(self.tokens)):
+            token = self.tokens[i]
+            if not token.startswith(term):
+                break
+            factor = 1 if token == term else PREFIX_MATCH_WEIGHT
+            for position, weight in self.postings[token].items():
+                scores[position] = max(scores.get(position, 0), weight * factor)
+        return scores
+
+    def search(self, query, filters=None, limit=SEARCH_RESULT_LIMIT):
+        """Returns items matching every word of the query, best first. Filters are catalog index
+        columns, such as category or is_ecomm."""
+        terms = tokenize(query)
+        if not terms:
+            return []
+        # The snapshot lock is held from the sync through the lookup so a refresh cannot change
+        # positions in between. It is re-entrant, so the sync can take it again.
+        with self.lock, self.snapshot.lock:
+            self.sync()
+            scores = None
+            for term in terms:
+                term_scores = self.matches(term)
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {k: v + term_scores[k] for k, v in scores.items() if k in term_scores}
+                if not scores:
+                    return []
+            if filters:
+                allowed = self.snapshot.find(**filters)
+                scores = {k: v for k, v in scores.items() if k in allowed}
+            columns = self.snapshot.columns
+            ranked = sorted(scores.items(), key=lambda x: (-x[1], columns["item_no"][x[0]]))[:limit]
+            return [{"item_no": columns["item_no"][position],
+                     "title": columns["web_title"][position] or columns["long_descr"][position],
+                     "binding_key": columns["binding_key"][position],
+                     "price": columns["price_1"][position],
+                     "quantity_available": columns["quantity_available"][position],
+                     "score": score} for position, score in ranked]
+
+
+search_index = SearchIndex()
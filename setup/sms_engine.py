@@ -55,20 +55,15 @@ def create_sms_log(name, phone, sent_message, response, log_location):
     """Creates a log file on share server. Logs date, phone, message, and twilio response"""
     log_message = sent_message
     log_data = [
-        [
-            str(datetime.now())[:-7],
-            name,
-            format_phone(phone, mode="Counterpoint"),
-            log_message.strip().replace("\n", ""),
-            response,
-        ]
+        str(datetime.now())[:-7],
+        name,
+        format_phone(phone, mode="Counterpoint"),
+        log_message.strip().replace("\n", ""),
+        response,
     ]
-    df = pandas.DataFrame(
-        log_data, columns=["date", "name", "to_phone", "body", "response"]
+    log_engine.write_log_row(
+        log_data, ["date", "name", "to_phone", "body", "response"], log_location
     )
-    # Looks for file. If it has been deleted, it will recreate.
-
-    log_engine.write_log(df, log_location)
 
 
 def format_phone(phone_number, mode="clickable", prefix=False):
@@ -115,17 +110,10 @@ def lookup_customer_data(phone):
     cp_phone_input = format_phone(phone, mode="counterpoint")
     # Create customer variables from tuple return of query_db
     db = QueryEngine()
-    query = f"""
-        SELECT FST_NAM, LST_NAM, CATEG_COD
-        FROM AR_CUST
-        WHERE PHONE_1 = '{format_phone(phone, mode="counterpoint")}'
-        """
-    response = db.query_db(query)
+    response = db.lookup_customer_name(cp_phone_input)
     if response is not None:
-        first_name = response[0][0]
-        last_name = response[0][1]
+        first_name, last_name, category = response
         full_name = first_name + " " + last_name
-        category = response[0][2]
         # For people with no phone in our database
     else:
         full_name = "Unknown"
@@ -244,16 +232,15 @@ def design_text(
 
 
 def unsubscribe_from_sms(phone_number):
-    query = f"""
+    query = """
     UPDATE AR_CUST
     SET INCLUDE_IN_MARKETING_MAILOUTS = 'N'
-    WHERE PHONE_1 = '{phone_number}' OR PHONE_2 = '{phone_number}'
+    WHERE PHONE_1 = ? OR PHONE_2 = ?
     """
     db = QueryEngine()
-    db.query_db(query=query, commit=True)
+    db.query_db(query=query, params=(phone_number, phone_number), commit=True)
 
     date = f"{datetime.now():%m-%d-%Y %H:%M:%S}"
 
-    log_data = [[date, phone_number]]
-    df = pandas.DataFrame(log_data, columns=["date", "phone"])
-    log_engine.write_log(df, creds.sms_unsubscribe)
+    log_data = [date, phone_number]
+    log_engine.write_log_row(log_data, ["date", "phone"], creds.sms_unsubscribe)
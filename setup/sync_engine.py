@@ -0,0 +1,101 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from setup.big_products import bc_update_products
+from setup.product_engine import db, get_ecomm_items, get_qty_sold_all_items
+
+# Total Sold Sync Settings
+# Last totals pushed to Big Commerce, keyed by product ID
+TOTAL_SOLD_STATE = "./total_sold_state.json"
+# Big Commerce accepts up to 10 products per batch update
+TOTAL_SOLD_BATCH_SIZE = 10
+TOTAL_SOLD_WORKERS = 4
+
+
+def get_binding_children():
+    """Returns {binding_id: [child skus]} for every bound item in one query"""
+    query = """
+    SELECT USR_PROF_ALPHA_16, ITEM_NO
+    FROM IM_ITEM
+    WHERE USR_PROF_ALPHA_16 IS NOT NULL
+    """
+    result = {}
+    for x in db.query_stream(query):
+        result.setdefault(x[0], []).append(x[1])
+    return result
+
+
+class TotalSoldSync:
+    """Pushes 'total_sold' to Big Commerce. Totals are computed in one pass, compared with the last
+    values pushed, and only changed products are sent in batch updates."""
+
+    def __init__(self, state_location=TOTAL_SOLD_STATE, batch_size=TOTAL_SOLD_BATCH_SIZE,
+                 workers=TOTAL_SOLD_WORKERS):
+        self.state_location = state_location
+        self.batch_size = batch_size
+        self.workers = workers
+        self.state = self.load_state()
+        self.lock = threading.Lock()
+
+    def load_state(self):
+        try:
+            with open(self.state_location, "r") as file:
+                return {int(k): v for k, v in json.load(file).items()}
+        except FileNotFoundError:
+            return {}
+
+    def save_state(self):
+        temp_location = self.state_location + ".tmp"
+        with open(temp_location, "w") as file:
+            json.dump(self.state, file)
+        os.replace(temp_location, self.state_location)
+
+    def compute_totals(self, qty_sold_all_items=None):
+        """Returns {product_id: total sold}. Bound products count the sales of all their children."""
+        ecomm_items = get_ecomm_items(mode=3)
+        if ecomm_items is None:
+            return {}
+        binding_children = get_binding_children()
+        if qty_sold_all_items is None:
+            qty_sold_all_items = get_qty_sold_all_items() or {}
+        totals = {}
+        for sku, product_id in ecomm_items:
+            if sku in binding_children:
+                total_sold = sum(qty_sold_all_items.get(x, 0) for x in binding_children[sku])
+            else:
+                total_sold = qty_sold_all_items.get(sku, 0)
+            if total_sold > 0:
+                totals[product_id] = total_sold
+        return totals
+
+    def push_batch(self, batch):
+        # The shared client paces requests by the rate limit headers and retries 429s
+        response = bc_update_products([{"id": k, "total_sold": v} for k, v in batch])
+        if response.status_code == 200:
+            updated = batch
+        elif response.status_code == 207:
+            # Partial success. Only the products listed in data were updated.
+            json_response = response.json()
+            updated_ids = {int(x["id"]) for x in json_response.get("data") or []}
+            updated = [(k, v) for k, v in batch if int(k) in updated_ids]
+            print(f"Batch update partly failed for products {[k for k, v in batch if int(k) not in updated_ids]}: "
+                  f"{json_response.get('errors')}")
+        else:
+            print(f"Batch update failed ({response.status_code}) for products {[k for k, v in batch]}")
+            return 0
+        with self.lock:
+            self.state.update(updated)
+        return len(updated)
+
+    def run(self, qty_sold_all_items=None):
+        totals = self.compute_totals(qty_sold_all_items)
+        changes = [(k, v) for k, v in totals.items() if self.state.get(k) != v]
+        batches = [changes[i:i + self.batch_size] for i in range(0, len(changes), self.batch_size)]
+        print(f"Total sold: {len(changes)} of {len(totals)} products changed. Sending {len(batches)} batches.")
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            updated = sum(executor.map(self.push_batch, batches))
+        self.save_state()
+        print(f"Total sold: updated {updated}/{len(changes)} products")
+        return updated